@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'alinea_api.middleware.mongo_metrics_middleware',
 ]
 
 ROOT_URLCONF = 'alinea.urls'
@@ -154,4 +155,84 @@ SWAGGER_SETTINGS = {
 }
 
 
-AUTH_USER_MODEL = 'alinea_api.CustomUser'
\ No newline at end of file
+AUTH_USER_MODEL = 'alinea_api.CustomUser'
+
+# MongoDB (patient documents)
+# A single pooled client is created lazily per process by alinea_api.db.mongo_client.
+
+MONGODB = {
+    'URI': 'mongodb://localhost:27017',
+    'DATABASE': 'users',
+    'MIN_POOL_SIZE': 0,
+    'MAX_POOL_SIZE': 100,
+    'MAX_IDLE_TIME_MS': 60000,
+    'WAIT_QUEUE_TIMEOUT_MS': 5000,
+    'SERVER_SELECTION_TIMEOUT_MS': 5000,
+    'CONNECT_TIMEOUT_MS': 5000,
+    # Number of NDJSON lines applied per bulk_write by the document import endpoint.
+    'BULK_IMPORT_BATCH_SIZE': 1000,
+    # Longest NDJSON line the import endpoint accepts; longer lines are skipped and reported.
+    'BULK_IMPORT_MAX_LINE_BYTES': 1024 * 1024,
+    # Log a warning at startup for indexes declared in DocumentService.INDEXES that are missing.
+    'CHECK_INDEXES_ON_STARTUP': False,
+    # Command monitoring: latency histograms served at /metrics/mongo/, and a warning on the
+    # alinea_api.db.monitoring logger for every command slower than SLOW_COMMAND_MS.
+    'MONITORING': {
+        'ENABLED': True,
+        'SLOW_COMMAND_MS': 100,
+    },
+    # Read-through cache for user documents. It must be shared by all workers (Redis), so that
+    # writes through DocumentService invalidate every process. Entry count/memory is bounded by
+    # the cache backend; documents larger than MAX_ENTRY_BYTES are never cached.
+    'CACHE': {
+        'ENABLED': False,
+        'ALIAS': 'documents',
+        'TTL': 300,
+        'MAX_ENTRY_BYTES': 256 * 1024,
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'documents': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+        'KEY_PREFIX': 'alinea',
+    },
+}
+
+# Websocket notifications about access requests. Changes made within COALESCE_WINDOW_MS of
+# each other (or in the same transaction) are sent as one event per access request and group;
+# 0 sends one event per change as soon as it is committed.
+# Events are sent by a background thread from a queue of QUEUE_SIZE messages, BATCH_SIZE at a
+# time. OVERFLOW_POLICY ('drop_newest', 'drop_oldest' or 'block' for up to BLOCK_TIMEOUT_MS)
+# applies when the channel layer cannot keep up; counters are served at /metrics/events/.
+# With OUTBOX, events are instead written to the EventOutbox table in the transaction of the
+# change and published at least once by 'manage.py relay_outbox', which must then be running.
+ACCESS_REQUEST_EVENTS = {
+    'COALESCE_WINDOW_MS': 200,
+    'QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 100,
+    'OVERFLOW_POLICY': 'drop_oldest',
+    'BLOCK_TIMEOUT_MS': 50,
+    'OUTBOX': False,
+}
+
+# Pending access request items older than this many days are moved to 'expired' by
+# 'manage.py expire_access_requests'. DATA_TYPES overrides ENTITY_TYPES, which overrides
+# DEFAULT_DAYS; None never expires.
+ACCESS_REQUEST_EXPIRY = {
+    'DEFAULT_DAYS': 30,
+    'ENTITY_TYPES': {},
+    'DATA_TYPES': {},
+}
+
+# Cached answers to "which data types may entity E read for user U" (and per access request).
+# The cache must be shared by all workers, since item status changes invalidate it.
+ACCESS_DECISIONS = {
+    'CACHE_ENABLED': False,
+    'CACHE_ALIAS': 'documents',
+    'TTL': 300,
+}
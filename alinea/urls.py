@@ -29,6 +29,7 @@ urlpatterns = [
     path('visits/', include('alinea_api.urls.visist_urls')),
     path('defaultfields/', include('alinea_api.urls.default_fields')),
     path('assignments/', include('alinea_api.urls.user_template_assignment_urls')),
+    path('metrics/', include('alinea_api.urls.metrics_urls')),
 
 
     path('websocket-test/', websocket_test, name='websocket_test'),
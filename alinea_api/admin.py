@@ -8,7 +8,7 @@ from .models import (
     AccessRequestItem,
     Visits,
     Template,
-    DefaultField, UserTemplateAssignment,
+    DefaultField, UserTemplateAssignment, EventOutbox, AccessRequestCounter,
 )
 
 User = get_user_model()  # This returns your CustomUser model
@@ -40,3 +40,18 @@ class UserTemplateAssignmentAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'template__name', 'entity__name')
     list_filter = ('status', 'assigned_at', 'entity')
     ordering = ('entity', 'user', 'template')
+
+
+@admin.register(EventOutbox)
+class EventOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'access_request_id', 'item_id', 'created_at', 'published_at', 'attempts',
+                    'dead_lettered_at')
+    list_filter = ('kind', 'published_at', 'dead_lettered_at')
+    ordering = ('-id',)
+
+
+@admin.register(AccessRequestCounter)
+class AccessRequestCounterAdmin(admin.ModelAdmin):
+    list_display = ('entity', 'data_type', 'status', 'count')
+    list_filter = ('status', 'data_type')
+    ordering = ('entity', 'data_type', 'status')
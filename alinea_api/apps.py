@@ -1,5 +1,10 @@
+import logging
+import threading
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class AlineaApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -7,4 +12,25 @@ class AlineaApiConfig(AppConfig):
 
     def ready(self):
         # Import signal handlers
-        from . import signals
\ No newline at end of file
+        from . import signals
+
+        from alinea_api.db.mongo_client import get_mongodb_settings
+        if get_mongodb_settings().get('CHECK_INDEXES_ON_STARTUP'):
+            # Run off the startup path so booting never waits on MongoDB.
+            threading.Thread(target=check_mongo_indexes, daemon=True).start()
+
+
+def check_mongo_indexes():
+    """
+    Logs a warning for every index declared in DocumentService.INDEXES that is missing.
+    """
+    from alinea_api.services.documents_service import document_service
+    try:
+        missing = document_service.missing_indexes()
+    except Exception as e:
+        logger.warning("Could not check MongoDB indexes: %s", e)
+        return
+    for index in missing:
+        logger.warning(
+            "MongoDB index %s is missing on the %s collection; run 'manage.py ensure_mongo_indexes'.",
+            index.document['name'], document_service.collection_name)
\ No newline at end of file
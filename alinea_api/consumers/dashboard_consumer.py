@@ -2,7 +2,9 @@ import json
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-from alinea_api.models import Entity, AccessRequest, AccessRequestItem, CustomUser
+from alinea_api.models import Entity, CustomUser
+from alinea_api.services.access_requests import create_access_request
+from alinea_api.services.notifications import encode, serialize_access_request
 
 
 class NotificationConsumer(AsyncWebsocketConsumer):
@@ -37,20 +39,19 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             user = await self.get_dummy_user()
             entity = await self.get_dummy_entity()
 
-            # Create AccessRequest
-            access_request = await database_sync_to_async(AccessRequest.objects.create)(entity=entity,
-                user=user, purpose='Requested via WebSocket')
-
-            # Create AccessRequestItems
-            for data_type in selected_data_types:
-                await database_sync_to_async(AccessRequestItem.objects.create)(
-                    access_request=access_request, data_type=data_type)
+            # Create the AccessRequest and its AccessRequestItems in one transaction
+            try:
+                payload = await self.create_access_request_with_items(entity, user, selected_data_types)
+            except (ValueError, TypeError) as e:
+                await self.send(text_data=encode({'error': str(e)}))
+                return
 
             # Prepare response
             response = {'message': 'AccessRequest and AccessRequestItems created successfully.',
-                'access_request_id': access_request.id, 'selected_data_types': selected_data_types}
-            await self.send(text_data=json.dumps(response))
-            print(f"Created AccessRequest {access_request.id} for user {user.username}")
+                'access_request_id': payload['id'], 'selected_data_types': selected_data_types,
+                'access_request': payload}
+            await self.send(text_data=encode(response))
+            print(f"Created AccessRequest {payload['id']} for user {user.username}")
 
         else:
             response = {'error': 'Invalid data received.'}
@@ -65,6 +66,15 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         print(f"Event received: {message}")
 
 
+    @database_sync_to_async
+    def create_access_request_with_items(self, entity, user, data_types):
+        # A single thread hop for the whole request, whatever the number of items.
+        if not isinstance(data_types, list) or not all(isinstance(data_type, str) for data_type in data_types):
+            raise TypeError('selected_data_types must be a list of strings.')
+        return serialize_access_request(*create_access_request(
+            entity, user, data_types, purpose='Requested via WebSocket'))
+
+
     @database_sync_to_async
     def get_dummy_user(self):
         # Get or create a dummy user with pk=1
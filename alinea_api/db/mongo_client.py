@@ -1,48 +1,318 @@
-from pymongo import MongoClient
-from pymongo.errors import ConfigurationError
+import asyncio
+import logging
+import os
+import threading
+import weakref
 
-def connect_to_mongodb(host="127.0.0.1", port=27017, username=None, password=None, database=None):
+from django.conf import settings
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.database import Database
+from pymongo.collection import Collection
+
+from alinea_api.db.monitoring import CommandStatsListener, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MONGODB_SETTINGS = {
+    'URI': 'mongodb://localhost:27017',
+    'DATABASE': 'users',
+    'MIN_POOL_SIZE': 0,
+    'MAX_POOL_SIZE': 100,
+    'MAX_IDLE_TIME_MS': 60000,
+    'WAIT_QUEUE_TIMEOUT_MS': 5000,
+    'SERVER_SELECTION_TIMEOUT_MS': 5000,
+    'CONNECT_TIMEOUT_MS': 5000,
+    'BULK_IMPORT_BATCH_SIZE': 1000,
+    'BULK_IMPORT_MAX_LINE_BYTES': 1024 * 1024,
+    'MONITORING': {
+        'ENABLED': True,
+        'SLOW_COMMAND_MS': 100,
+    },
+}
+
+
+def get_mongodb_settings() -> dict:
+    """
+    Returns the MongoDB settings, with the project ``MONGODB`` setting applied over the defaults.
+    """
+    return {**DEFAULT_MONGODB_SETTINGS, **getattr(settings, 'MONGODB', {})}
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Keeps running counters of connection pool events, and a histogram of how long checkouts
+    waited for a connection, so they can be reported by ``pool_stats``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout_wait = LatencyHistogram()
+        self.counters = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checked_out': 0,
+            'checked_in': 0,
+            'check_out_failures': 0,
+            'pools_cleared': 0,
+        }
+
+    def _increment(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _observe_wait(self, event):
+        # ``duration`` (seconds) is reported by pymongo 4.7+.
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            with self._lock:
+                self._checkout_wait.observe(duration * 1000.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            counters['checkout_wait'] = self._checkout_wait.snapshot()
+        counters['open_connections'] = counters['connections_created'] - counters['connections_closed']
+        counters['in_use'] = counters['checked_out'] - counters['checked_in']
+        return counters
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._increment('pools_cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._increment('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._increment('connections_closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._increment('check_out_failures')
+        self._observe_wait(event)
+
+    def connection_checked_out(self, event):
+        self._increment('checked_out')
+        self._observe_wait(event)
+
+    def connection_checked_in(self, event):
+        self._increment('checked_in')
+
+
+class MongoClientRegistry:
     """
-    Connects to a MongoDB server.
+    Process-wide registry holding a single, lazily created MongoClient, and one AsyncMongoClient
+    per event loop.
 
-    :param host: MongoDB host (default: localhost)
-    :param port: MongoDB port (default: 27017)
-    :param username: MongoDB username (optional)
-    :param password: MongoDB password (optional)
-    :param database: Default database to connect to (optional)
-    :return: A MongoClient instance
+    Nothing talks to MongoDB until the first collection is used, so importing views or forking
+    workers never blocks on the database. Clients are recreated after a fork because pymongo
+    clients are not fork-safe.
     """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        # event loop -> the AsyncMongoClient bound to it.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._pool_listener = PoolStatsListener()
+        self._command_listener = None
+
+    def _reset_after_fork(self):
+        # Called with the lock held. Clients and counters inherited from a parent process
+        # describe the parent's pool, not ours, so they are dropped without closing.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._client = None
+            self._async_clients = weakref.WeakKeyDictionary()
+            self._pool_listener = PoolStatsListener()
+            self._command_listener = None
+
+    def _event_listeners(self) -> list:
+        # Called with the lock held. The command listener is shared by the sync and async
+        # clients and only registered when monitoring is enabled, to keep it off the hot path.
+        monitoring_config = get_mongodb_settings()['MONITORING']
+        if not monitoring_config.get('ENABLED', True):
+            return [self._pool_listener]
+        if self._command_listener is None:
+            self._command_listener = CommandStatsListener(monitoring_config.get('SLOW_COMMAND_MS'))
+        return [self._pool_listener, self._command_listener]
+
+    def _client_options(self) -> dict:
+        config = get_mongodb_settings()
+        return {
+            'minPoolSize': config['MIN_POOL_SIZE'],
+            'maxPoolSize': config['MAX_POOL_SIZE'],
+            'maxIdleTimeMS': config['MAX_IDLE_TIME_MS'],
+            'waitQueueTimeoutMS': config['WAIT_QUEUE_TIMEOUT_MS'],
+            'serverSelectionTimeoutMS': config['SERVER_SELECTION_TIMEOUT_MS'],
+            'connectTimeoutMS': config['CONNECT_TIMEOUT_MS'],
+            'event_listeners': self._event_listeners(),
+        }
+
+    def get_client(self) -> MongoClient:
+        """
+        Returns the shared MongoClient, creating it on first use in this process.
+        """
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                self._reset_after_fork()
+                if self._client is None:
+                    uri = get_mongodb_settings()['URI']
+                    logger.info("Creating MongoDB client for %s", uri)
+                    self._client = MongoClient(uri, connect=False, **self._client_options())
+        return self._client
+
+    def get_async_client(self) -> AsyncMongoClient:
+        """
+        Returns the AsyncMongoClient of the running event loop, creating it on first use.
+
+        Async clients are bound to the loop they first run on, so each loop gets its own (e.g.
+        every ``async_to_sync`` call outside ASGI runs on a new loop). Clients of loops that
+        have since been closed are closed when the next one is created.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop) if self._pid == os.getpid() else None
+        if client is None:
+            with self._lock:
+                self._reset_after_fork()
+                client = self._async_clients.get(loop)
+                if client is None:
+                    self._close_async_clients(closed_loops_only=True)
+                    uri = get_mongodb_settings()['URI']
+                    logger.info("Creating async MongoDB client for %s", uri)
+                    client = AsyncMongoClient(uri, connect=False, **self._client_options())
+                    self._async_clients[loop] = client
+        return client
+
+    def _close_async_clients(self, closed_loops_only: bool = False):
+        # Called with the lock held.
+        for loop, client in list(self._async_clients.items()):
+            if closed_loops_only and not loop.is_closed():
+                continue
+            del self._async_clients[loop]
+            _close_async_client(loop, client)
+
+    def get_database(self, database_name: str = None) -> Database:
+        """
+        Returns a database from the shared client, defaulting to ``MONGODB['DATABASE']``.
+        """
+        return self.get_client()[database_name or get_mongodb_settings()['DATABASE']]
+
+    def get_collection(self, collection_name: str, database_name: str = None) -> Collection:
+        """
+        Returns a collection from the shared client.
+        """
+        return self.get_database(database_name)[collection_name]
+
+    def get_async_collection(self, collection_name: str, database_name: str = None) -> AsyncCollection:
+        """
+        Returns a collection from the shared async client. Must be called from a running loop.
+        """
+        database = self.get_async_client()[database_name or get_mongodb_settings()['DATABASE']]
+        return database[collection_name]
+
+    def pool_stats(self) -> dict:
+        """
+        Returns connection pool counters plus the configured pool limits.
+        """
+        config = get_mongodb_settings()
+        stats = self._pool_listener.snapshot()
+        current_process = self._pid == os.getpid()
+        stats.update({
+            'connected': current_process and self._client is not None,
+            'async_connected': current_process and len(self._async_clients) > 0,
+            'min_pool_size': config['MIN_POOL_SIZE'],
+            'max_pool_size': config['MAX_POOL_SIZE'],
+            'max_idle_time_ms': config['MAX_IDLE_TIME_MS'],
+        })
+        return stats
+
+    def command_stats(self) -> dict:
+        """
+        Returns per-command and per-endpoint latency histograms and error counts, or an empty
+        report when monitoring is disabled or no client was created yet.
+        """
+        listener = self._command_listener if self._pid == os.getpid() else None
+        if listener is None:
+            return {'enabled': False}
+        return {'enabled': True, **listener.snapshot()}
+
+    def close(self):
+        """
+        Closes the shared sync client and every async client. New ones are created on the next
+        use. Async clients are closed on their own loop when it is still open (in the
+        background if it is running), and on a throwaway loop otherwise.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                if self._client is not None:
+                    self._client.close()
+                self._close_async_clients()
+            self._client = None
+            self._async_clients = weakref.WeakKeyDictionary()
+
+
+def _close_async_client(loop, client: AsyncMongoClient):
     try:
-        if username and password:
-            # Connect with authentication
-            uri = f"mongodb://{username}:{password}@{host}:{port}"
+        if loop.is_closed():
+            # The client's own loop is gone; close what is left of it on a loop of its own, in
+            # a thread in case this one is running a loop.
+            threading.Thread(target=_close_on_new_loop, args=(client,), daemon=True).start()
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
         else:
-            # Connect without authentication
-            uri = f"mongodb://{host}:{port}"
+            loop.run_until_complete(client.close())
+    except Exception:
+        logger.warning("Could not close async MongoDB client", exc_info=True)
 
-        # Create a client instance
-        client = MongoClient(uri, serverSelectionTimeoutMS=5000)
 
-        # Test connection
-        client.server_info()  # Will raise an exception if unable to connect
+def _close_on_new_loop(client: AsyncMongoClient):
+    try:
+        asyncio.run(client.close())
+    except Exception:
+        logger.debug("Could not close async MongoDB client of a closed loop", exc_info=True)
 
-        if database:
-            print(f"Connected to MongoDB database: {database}")
-            return client[database]  # Return the specific database
-        else:
-            print("Connected to MongoDB server")
-            return client  # Return the client for general use
-    except ConfigurationError as conf_err:
-        print(f"Configuration error: {conf_err}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-
-# Example Usage
-if __name__ == "__main__":
-    # Replace with your MongoDB credentials if needed
-    client = connect_to_mongodb()
-
-    # List databases
-    if client:
-        print("Databases available:")
-        print(client.list_database_names())
+
+mongo_registry = MongoClientRegistry()
+
+
+def get_collection(collection_name: str, database_name: str = None) -> Collection:
+    """
+    Shortcut for ``mongo_registry.get_collection``.
+    """
+    return mongo_registry.get_collection(collection_name, database_name)
+
+
+def get_async_collection(collection_name: str, database_name: str = None) -> AsyncCollection:
+    """
+    Shortcut for ``mongo_registry.get_async_collection``.
+    """
+    return mongo_registry.get_async_collection(collection_name, database_name)
+
+
+def pool_stats() -> dict:
+    """
+    Shortcut for ``mongo_registry.pool_stats``.
+    """
+    return mongo_registry.pool_stats()
+
+
+def command_stats() -> dict:
+    """
+    Shortcut for ``mongo_registry.command_stats``.
+    """
+    return mongo_registry.command_stats()
@@ -0,0 +1,140 @@
+import bisect
+import contextvars
+import logging
+import threading
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# The request being served, set by mongo_metrics_middleware so that MongoDB time can be
+# attributed to the endpoint that spent it.
+current_request = contextvars.ContextVar('mongo_current_request', default=None)
+
+
+def current_endpoint() -> str:
+    """
+    The URL pattern name of the request being served, or None outside a request or before its
+    URL is resolved. Pattern names keep the metric labels bounded, unlike raw paths.
+    """
+    match = getattr(current_request.get(), 'resolver_match', None)
+    return match.view_name if match is not None else None
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram. Not thread-safe; callers hold their own lock.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def _quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation (max_ms for the last bucket).
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ['inf']
+        return {
+            'count': self.count,
+            'avg_ms': self.total_ms / self.count if self.count else None,
+            'max_ms': self.max_ms,
+            'p50_ms': self._quantile(0.5) if self.count else None,
+            'p95_ms': self._quantile(0.95) if self.count else None,
+            'p99_ms': self._quantile(0.99) if self.count else None,
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+def _collection_of(event) -> str:
+    value = event.command.get(event.command_name)
+    if isinstance(value, str):
+        return value
+    # getMore carries the cursor id under the command name and the collection separately.
+    return event.command.get('collection')
+
+
+class CommandStatsListener(monitoring.CommandListener):
+    """
+    Records latency histograms per (command, collection) and per endpoint, counts failed
+    commands, and logs commands slower than ``slow_command_ms`` on this module's logger.
+    """
+
+    def __init__(self, slow_command_ms: float = None):
+        self.slow_command_ms = slow_command_ms
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._commands = {}
+        self._endpoints = {}
+        self._errors = {}
+        self._slow = 0
+
+    def started(self, event):
+        key = (event.connection_id, event.request_id)
+        labels = (_collection_of(event), current_endpoint())
+        with self._lock:
+            self._in_flight[key] = labels
+
+    def _finish(self, event):
+        duration_ms = event.duration_micros / 1000.0
+        slow = self.slow_command_ms is not None and duration_ms >= self.slow_command_ms
+        with self._lock:
+            collection, endpoint = self._in_flight.pop((event.connection_id, event.request_id), (None, None))
+            self._commands.setdefault((event.command_name, collection), LatencyHistogram()).observe(duration_ms)
+            if endpoint is not None:
+                self._endpoints.setdefault(endpoint, LatencyHistogram()).observe(duration_ms)
+            if slow:
+                self._slow += 1
+        if slow:
+            logger.warning(
+                "Slow MongoDB command %s on %s.%s took %.1f ms (endpoint: %s)",
+                event.command_name, event.database_name, collection, duration_ms, endpoint or '-')
+        return collection
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        # Keyed by error code (or exception type for network errors), never by message, so the
+        # number of error labels stays bounded.
+        failure = event.failure
+        code_name = str(failure.get('codeName') or failure.get('code') or failure.get('errtype') or 'unknown')
+        with self._lock:
+            key = (event.command_name, collection, code_name)
+            self._errors[key] = self._errors.get(key, 0) + 1
+        logger.info("MongoDB command %s on %s failed: %s", event.command_name, collection, code_name)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'slow_command_ms': self.slow_command_ms,
+                'slow_commands': self._slow,
+                'commands': [
+                    {'command': command, 'collection': collection, **histogram.snapshot()}
+                    for (command, collection), histogram in sorted(self._commands.items(), key=str)
+                ],
+                'endpoints': {endpoint: histogram.snapshot() for endpoint, histogram in sorted(self._endpoints.items())},
+                'errors': [
+                    {'command': command, 'collection': collection, 'error': code_name, 'count': count}
+                    for (command, collection, code_name), count in sorted(self._errors.items(), key=str)
+                ],
+            }
@@ -0,0 +1,71 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+
+from alinea_api.services.documents_service import document_service
+
+
+class Command(BaseCommand):
+    help = "Create the MongoDB indexes declared in DocumentService.INDEXES (idempotent)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds between index build progress reports.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the indexes that would be created.")
+
+    def handle(self, *args, **options):
+        try:
+            missing = document_service.missing_indexes()
+        except PyMongoError as e:
+            raise CommandError(f"Could not read indexes from MongoDB: {e}")
+
+        if not missing:
+            self.stdout.write(self.style.SUCCESS('All MongoDB indexes are in place.'))
+            return
+
+        for index in missing:
+            self.stdout.write(f"Missing index: {index.document['name']} {dict(index.document['key'])}")
+        if options['dry_run']:
+            return
+
+        outcome = {}
+        worker = threading.Thread(target=self._build, args=(outcome,), daemon=True)
+        worker.start()
+        while worker.is_alive():
+            worker.join(options['poll_interval'])
+            if worker.is_alive():
+                self._report_progress()
+
+        if 'error' in outcome:
+            raise CommandError(f"Index build failed: {outcome['error']}")
+        for name in outcome['created']:
+            self.stdout.write(self.style.SUCCESS(f"Created index: {name}"))
+
+    def _build(self, outcome):
+        try:
+            outcome['created'] = document_service.ensure_indexes()
+        except Exception as e:
+            outcome['error'] = e
+
+    def _report_progress(self):
+        """
+        Prints the progress of in-flight index builds on the users collection, as reported by
+        ``$currentOp``. Reporting is best effort: missing privileges just skip the report.
+        """
+        collection = document_service.collection
+        try:
+            operations = collection.database.client.admin.aggregate([
+                {'$currentOp': {}},
+                {'$match': {'command.createIndexes': collection.name}},
+            ])
+            for operation in operations:
+                progress = operation.get('progress')
+                if progress and progress.get('total'):
+                    percent = 100.0 * progress['done'] / progress['total']
+                    self.stdout.write(f"{operation.get('msg', 'Index build')}: {percent:.1f}%")
+                else:
+                    self.stdout.write(operation.get('msg', 'Index build in progress...'))
+        except PyMongoError:
+            self.stdout.write('Index build in progress...')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from alinea_api.services.dispatch import event_dispatcher
+from alinea_api.services.events import event_coalescer
+from alinea_api.services.expiry import count_expirable, expire_pending_items
+
+
+class Command(BaseCommand):
+    help = ("Move pending access request items past their expiry (settings.ACCESS_REQUEST_EXPIRY) "
+            "to 'expired', in short chunked transactions")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Items expired per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between chunks.")
+        parser.add_argument('--max-chunks', type=int, default=None,
+                            help="Stop after this many chunks.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count the items that would expire.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{count_expirable()} pending items would expire.")
+            return
+        expired = expire_pending_items(
+            chunk_size=options['chunk_size'], pause=options['pause'], max_chunks=options['max_chunks'])
+        # Send the events of the last coalescing window and wait for the dispatcher to deliver
+        # them, rather than relying on the exit handlers.
+        event_coalescer.close()
+        event_dispatcher.close()
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} pending items."))
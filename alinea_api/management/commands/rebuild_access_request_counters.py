@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from alinea_api.services import counters
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the per-entity access request counters from the AccessRequestItem table. "
+            "Needed after items are changed with QuerySet.update() or raw SQL, which bypass the "
+            "signals that maintain them.")
+
+    def handle(self, *args, **options):
+        written = counters.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} access request counters."))
@@ -0,0 +1,63 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from alinea_api.services.outbox import purge_published, relay_batch
+
+# Longest pause between retries while the channel layer keeps failing.
+MAX_BACKOFF = 30.0
+
+
+class Command(BaseCommand):
+    help = "Publish EventOutbox rows to the channel layer (at least once) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Outbox rows published per batch.")
+        parser.add_argument('--max-attempts', type=int, default=10,
+                            help="Failed publishes after which a row is dead-lettered.")
+        parser.add_argument('--lease-seconds', type=float, default=60.0,
+                            help="How long a claimed row is reserved for this relay.")
+        parser.add_argument('--poll-interval', type=float, default=0.5,
+                            help="Seconds to wait when the outbox is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Publish what is pending, then exit.")
+        parser.add_argument('--purge-after-days', type=int, default=7,
+                            help="Delete rows published longer ago than this (0 keeps them).")
+
+    def handle(self, *args, **options):
+        backoff = options['poll_interval']
+        last_purge = None
+        while True:
+            close_old_connections()
+            if options['purge_after_days'] and (last_purge is None or time.monotonic() - last_purge > 3600):
+                deleted = purge_published(timezone.now() - timedelta(days=options['purge_after_days']))
+                if deleted:
+                    self.stdout.write(f"Purged {deleted} published outbox rows.")
+                last_purge = time.monotonic()
+
+            try:
+                result = relay_batch(options['batch_size'], options['max_attempts'], options['lease_seconds'])
+            except Exception as e:
+                self.stderr.write(f"Outbox relay failed: {e}")
+                result = None
+
+            if result is not None and result.published:
+                self.stdout.write(f"Published {result.published} outbox rows.")
+            if result is not None and result.dead_lettered:
+                self.stderr.write(f"Dead-lettered {result.dead_lettered} outbox rows.")
+            if result is None or result.failed:
+                if options['once']:
+                    raise CommandError("Some outbox rows could not be published.")
+                # Retry the same rows with exponential backoff while the channel layer is down.
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+            backoff = options['poll_interval']
+            if result.rows < options['batch_size']:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
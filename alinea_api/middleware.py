@@ -0,0 +1,28 @@
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from alinea_api.db.monitoring import current_request
+
+
+@sync_and_async_middleware
+def mongo_metrics_middleware(get_response):
+    """
+    Makes the request being served available to the MongoDB command monitoring, which labels
+    each command with the request's URL pattern name (``request.resolver_match``, set by
+    Django once the URL is resolved) to report database time per endpoint.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current_request.set(request)
+            try:
+                return await get_response(request)
+            finally:
+                current_request.reset(token)
+    else:
+        def middleware(request):
+            token = current_request.set(request)
+            try:
+                return get_response(request)
+            finally:
+                current_request.reset(token)
+    return middleware
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alinea_api', '0004_alter_template_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('access_request_created', 'Access request created'), ('access_request_updated', 'Access request updated'), ('item_status', 'Item status changed')], max_length=32)),
+                ('access_request_id', models.BigIntegerField()),
+                ('entity_id', models.BigIntegerField(blank=True, null=True)),
+                ('item_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['published_at', 'id'], name='outbox_unpublished_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alinea_api', '0005_eventoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accessrequest',
+            index=models.Index(fields=['entity', 'requested_at', 'id'], name='accessreq_entity_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessrequest',
+            index=models.Index(fields=['user', 'requested_at', 'id'], name='accessreq_user_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessrequestitem',
+            index=models.Index(fields=['access_request', 'status'], name='accessitem_request_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessrequestitem',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='accessitem_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alinea_api', '0006_access_request_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessRequestCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_type', models.CharField(choices=[('personal_info', 'Personal Information'), ('medical_info', 'Medical Information'), ('dental', 'Dental Questionnaire'), ('psychological_info', 'Psychological Information')], max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_request_counters', to='alinea_api.entity')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('entity', 'data_type', 'status'), name='unique_access_request_counter')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alinea_api', '0007_accessrequestcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accessrequestitem',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('expired', 'Expired')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='accessrequestcounter',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('expired', 'Expired')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alinea_api', '0008_expired_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventoutbox',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventoutbox',
+            name='dead_lettered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RemoveIndex(
+            model_name='eventoutbox',
+            name='outbox_unpublished_idx',
+        ),
+        migrations.AddIndex(
+            model_name='eventoutbox',
+            index=models.Index(fields=['published_at', 'dead_lettered_at', 'id'], name='outbox_pending_idx'),
+        ),
+    ]
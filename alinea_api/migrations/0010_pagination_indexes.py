@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alinea_api', '0009_eventoutbox_claims'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accessrequest',
+            index=models.Index(fields=['requested_at', 'id'], name='accessreq_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessrequestitem',
+            index=models.Index(fields=['created_at', 'id'], name='accessitem_created_idx'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User, AbstractUser
 from django.conf import settings
 
@@ -16,6 +16,7 @@ STATUS_CHOICES = [
     ('pending', 'Pending'),
     ('approved', 'Approved'),
     ('rejected', 'Rejected'),
+    ('expired', 'Expired'),
 ]
 DOCUMENT_TYPE_CHOICES = [
     ('personal_info', 'Personal Information'),
@@ -65,17 +66,90 @@ class Entity(models.Model):
         return f"{self.name} ({self.get_entity_type_display()})"
 
 
-class AccessRequest(models.Model):
+class TrackedFieldsMixin:
+    """
+    Remembers the database values of ``TRACKED_FIELDS`` when an instance is loaded or saved,
+    so that changes can be detected on save without querying the previous row. Subclasses
+    call ``mark_saved`` once their ``save`` (and its post_save handlers) ran.
+    """
+    TRACKED_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot(field_names)
+        return instance
+
+    def _snapshot(self, field_names=None):
+        # Deferred fields are skipped: reading them here would cost a query each.
+        if not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        deferred = self.get_deferred_fields()
+        for name in self.TRACKED_FIELDS:
+            if name not in deferred and (field_names is None or name in field_names):
+                self._loaded_values[name] = getattr(self, name)
+
+    def has_changed(self, field_name: str) -> bool:
+        """
+        Whether a tracked field differs from its value when the instance was loaded or last
+        saved. Instances that were never loaded from or saved to the database have no changes.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        return field_name in loaded and loaded[field_name] != getattr(self, field_name)
+
+    def previous_value(self, field_name: str):
+        """
+        The value of a tracked field when the instance was loaded or last saved, or None if
+        unknown.
+        """
+        return getattr(self, '_loaded_values', {}).get(field_name)
+
+    def mark_saved(self, field_names=None):
+        """
+        Records the current values as the database state. ``save`` does this itself; call it
+        after writing instances with ``bulk_update``, once their changes have been handled.
+
+        :param field_names: Only record these fields (names or attnames, as ``update_fields``).
+        """
+        if field_names is not None:
+            field_names = {self._meta.get_field(name).attname for name in field_names}
+        self._snapshot(field_names)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self.mark_saved(fields)
+
+
+class AccessRequest(TrackedFieldsMixin, models.Model):
     entity = models.ForeignKey(Entity, on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     requested_at = models.DateTimeField(auto_now_add=True)
     purpose = models.CharField(max_length=255, blank=True)
 
+    class Meta:
+        # Entity inboxes and user dashboards list requests newest first, and so does the
+        # unfiltered listing (AccessRequestCursorPagination).
+        indexes = [
+            models.Index(fields=['requested_at', 'id'], name='accessreq_requested_idx'),
+            models.Index(fields=['entity', 'requested_at', 'id'], name='accessreq_entity_requested_idx'),
+            models.Index(fields=['user', 'requested_at', 'id'], name='accessreq_user_requested_idx'),
+        ]
+
+    # Cached access decisions are keyed by (entity, user); a change of either must also drop
+    # the previous pair's.
+    TRACKED_FIELDS = ('entity_id', 'user_id')
+
     def __str__(self):
         return f"AccessRequest by {self.entity} for {self.user}"
 
+    def save(self, *args, **kwargs):
+        # Like AccessRequestItem.save: the post_save handlers' writes (outbox) commit with the row.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self.mark_saved(kwargs.get('update_fields'))
+
 
-class AccessRequestItem(models.Model):
+class AccessRequestItem(TrackedFieldsMixin, models.Model):
     access_request = models.ForeignKey(AccessRequest, on_delete=models.CASCADE, related_name='items')
     data_type = models.CharField(max_length=50, choices=DOCUMENT_TYPE_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -83,6 +157,90 @@ class AccessRequestItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     rejection_reason = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Items of a request by status (inbox status filter).
+            models.Index(fields=['access_request', 'status'], name='accessitem_request_status_idx'),
+            # Items by status, oldest first.
+            models.Index(fields=['status', 'created_at', 'id'], name='accessitem_status_created_idx'),
+            # All items, newest first (AccessRequestItemCursorPagination).
+            models.Index(fields=['created_at', 'id'], name='accessitem_created_idx'),
+        ]
+
+    # Fields whose database values are remembered when an item is loaded, so that changes can
+    # be detected on save without querying the previous row.
+    TRACKED_FIELDS = ('status', 'status_set_at', 'rejection_reason', 'data_type', 'access_request_id')
+
+    @property
+    def previous_status(self):
+        return self.previous_value('status')
+
+    def save(self, *args, **kwargs):
+        # post_save handlers run inside super().save() and still see the previous values. The
+        # transaction makes their writes (counters, outbox) atomic with the item's own.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self.mark_saved(kwargs.get('update_fields'))
+
+
+class AccessRequestCounter(models.Model):
+    """
+    Number of access request items per entity, data type and status, kept up to date by the
+    item signals and services (see alinea_api.services.counters).
+    """
+    entity = models.ForeignKey(Entity, on_delete=models.CASCADE, related_name='access_request_counters')
+    data_type = models.CharField(max_length=50, choices=DOCUMENT_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['entity', 'data_type', 'status'], name='unique_access_request_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_id} {self.data_type} {self.status}: {self.count}"
+
+
+class EventOutbox(models.Model):
+    """
+    Websocket events written in the same transaction as the change they announce, and
+    published to the channel layer by the ``relay_outbox`` command (at least once). Rows that
+    keep failing are dead-lettered after the relay's maximum number of attempts.
+    """
+    KIND_CHOICES = [
+        ('access_request_created', 'Access request created'),
+        ('access_request_updated', 'Access request updated'),
+        ('item_status', 'Item status changed'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    # Plain ids rather than foreign keys: events outlive the rows they mention.
+    access_request_id = models.BigIntegerField()
+    entity_id = models.BigIntegerField(null=True, blank=True)
+    item_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Set while a relay is publishing the row; other relays skip it until then.
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # Set when the row was given up on; it is kept for inspection but never relayed again.
+    dead_lettered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['published_at', 'dead_lettered_at', 'id'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        if self.published_at:
+            state = 'published'
+        elif self.dead_lettered_at:
+            state = 'dead-lettered'
+        else:
+            state = 'pending'
+        return f"{self.kind} #{self.access_request_id} ({state})"
+
 
 class Visits(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AccessRequestCursorPagination(CursorPagination):
+    """
+    Keyset pagination over access requests, newest first. Each page is a range scan on the
+    ([entity|user,] requested_at, id) indexes, so deep pages cost the same as the first one.
+    """
+    ordering = ('-requested_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class AccessRequestItemCursorPagination(CursorPagination):
+    """
+    Keyset pagination over access request items, newest first, on the ([status,] created_at, id)
+    indexes.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
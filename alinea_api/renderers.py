@@ -0,0 +1,18 @@
+from rest_framework.renderers import BaseRenderer
+
+from alinea_api.serializers import dumps_document
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON renderer backed by orjson that also encodes BSON types (ObjectId, Decimal128, ...),
+    so MongoDB documents can be returned in a Response as-is.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps_document(data)
@@ -1,14 +1,20 @@
 # serializers.py
 
+import base64
+import json
 from datetime import datetime
+from decimal import Decimal
 
-from bson import ObjectId
+import orjson
+from bson import Decimal128, ObjectId
+from django.utils.functional import Promise
 from rest_framework import serializers
 from .models import (
     Entity,
     AccessRequest,
     AccessRequestItem,
     CustomUser, Template, Visits, DefaultField, UserTemplateAssignment,
+    DOCUMENT_TYPE_CHOICES,
 )
 from rest_framework import serializers
 
@@ -22,6 +28,16 @@ class AccessRequestSerializer(serializers.ModelSerializer):
         model = AccessRequest
         fields = '__all__'
 
+class AccessRequestWithItemsSerializer(serializers.Serializer):
+    """
+    Input of the endpoint that creates an access request together with its items.
+    """
+    entity = serializers.PrimaryKeyRelatedField(queryset=Entity.objects.all())
+    user = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all())
+    purpose = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    data_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=DOCUMENT_TYPE_CHOICES), allow_empty=False)
+
 class AccessRequestItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = AccessRequestItem
@@ -47,6 +63,49 @@ def serialize_document(doc):
     else:
         return doc
 
+
+def _json_default(obj):
+    """
+    orjson ``default`` hook for the BSON and Django types orjson does not encode natively.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (Decimal128, Decimal)):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode('ascii')
+    if isinstance(obj, Promise):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_document(doc) -> bytes:
+    """
+    Encodes a MongoDB document (or any response payload containing one) to JSON bytes in a
+    single pass. Values are encoded as ``serialize_document`` would convert them, without
+    building an intermediate copy of the document.
+    """
+    return orjson.dumps(doc, default=_json_default)
+
+
+def flatten_document(doc, prefix='', exclude=()):
+    """
+    Flattens a serialized document into a single-level dict with dotted keys, for CSV export.
+    Lists are kept as JSON strings; top-level keys in ``exclude`` are left out.
+    """
+    flat = {}
+    for key, value in doc.items():
+        if key in exclude:
+            continue
+        column = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_document(value, f"{column}."))
+        elif isinstance(value, list):
+            flat[column] = json.dumps(value)
+        else:
+            flat[column] = value
+    return flat
+
 class VisitsSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
@@ -0,0 +1,221 @@
+import logging
+import uuid
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from alinea_api.models import AccessRequest, AccessRequestItem, STATUS_CHOICES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DECISION_SETTINGS = {
+    'CACHE_ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'TTL': 300,
+}
+
+
+class RequestDecision(NamedTuple):
+    entity_id: int
+    user_id: int
+    # status -> data types of the request's items in that status.
+    data_types_by_status: dict
+
+
+def get_decision_settings() -> dict:
+    """
+    Returns the ``ACCESS_DECISIONS`` setting applied over the defaults.
+    """
+    return {**DEFAULT_DECISION_SETTINGS, **getattr(settings, 'ACCESS_DECISIONS', {})}
+
+
+class DecisionCache:
+    """
+    Cache of access decisions with generation tokens, like DocumentCache: each key has a token
+    stored next to its entry, invalidation replaces the token, and an entry computed from rows
+    read before a concurrent change is stored under the old token and never served.
+
+    The cache is never required: when the backend fails, lookups are misses without a token
+    (answered from the database and not stored) and failed invalidations are logged; their
+    entries expire after ``TTL``.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return bool(get_decision_settings()['CACHE_ENABLED'])
+
+    @property
+    def backend(self):
+        return caches[get_decision_settings()['CACHE_ALIAS']]
+
+    @staticmethod
+    def _keys(key: str):
+        return f"access:{key}:generation", f"access:{key}:value"
+
+    def get_many(self, keys) -> dict:
+        """
+        Looks up many keys in one cache round trip, plus one write to seed the generation
+        tokens of keys that have none yet.
+
+        :return: A dict of key -> (hit, value, token).
+        """
+        keys = list(keys)
+        if not self.enabled:
+            return {key: (False, None, None) for key in keys}
+        names = {key: self._keys(key) for key in keys}
+        try:
+            values = self.backend.get_many([name for pair in names.values() for name in pair])
+            # As in DocumentCache, missing tokens are seeded with one set_many; a new token
+            # matches no stored entry, so overwriting a concurrent one only costs a miss.
+            seeds = {generation_key: uuid.uuid4().hex
+                     for generation_key, _ in names.values() if values.get(generation_key) is None}
+            if seeds:
+                self.backend.set_many(seeds, get_decision_settings()['TTL'])
+        except Exception:
+            logger.warning("Access decision cache lookup failed; falling back to the database", exc_info=True)
+            return {key: (False, None, None) for key in keys}
+        lookups = {}
+        for key, (generation_key, value_key) in names.items():
+            token = values.get(generation_key) or seeds[generation_key]
+            entry = values.get(value_key)
+            if entry is not None and entry[0] == token:
+                lookups[key] = (True, entry[1], token)
+            else:
+                lookups[key] = (False, None, token)
+        return lookups
+
+    def set_many(self, values: dict, tokens: dict):
+        entries = {self._keys(key)[1]: (tokens[key], value) for key, value in values.items() if tokens[key]}
+        if not entries:
+            return
+        try:
+            self.backend.set_many(entries, get_decision_settings()['TTL'])
+        except Exception:
+            logger.warning("Access decision cache write failed", exc_info=True)
+
+    def invalidate(self, keys):
+        if not self.enabled:
+            return
+        keys = set(keys)
+        if not keys:
+            return
+        try:
+            self.backend.set_many({self._keys(key)[0]: uuid.uuid4().hex for key in keys},
+                                  get_decision_settings()['TTL'])
+        except Exception:
+            # Runs after commit: the change is already saved and must not fail because of the cache.
+            logger.error("Access decision cache invalidation failed; %d keys stay cached until they expire",
+                         len(keys), exc_info=True)
+
+
+decision_cache = DecisionCache()
+
+
+def _pair_key(entity_id, user_id) -> str:
+    return f"entity:{int(entity_id)}:user:{int(user_id)}"
+
+
+def _request_key(access_request_id) -> str:
+    return f"request:{int(access_request_id)}"
+
+
+def allowed_data_types_many(entity_id: int, user_ids) -> dict:
+    """
+    Data types each user has approved for an entity, across all the entity's access requests.
+    Costs one cache round trip, plus one query for all the users that missed.
+
+    :return: A dict of user_id -> frozenset of data types.
+    """
+    user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+    lookups = decision_cache.get_many(_pair_key(entity_id, user_id) for user_id in user_ids)
+    allowed = {}
+    missing = []
+    for user_id in user_ids:
+        hit, value, _ = lookups[_pair_key(entity_id, user_id)]
+        if hit:
+            allowed[user_id] = frozenset(value)
+        else:
+            missing.append(user_id)
+
+    if missing:
+        fetched = {user_id: set() for user_id in missing}
+        rows = (
+            AccessRequestItem.objects
+            .filter(access_request__entity_id=entity_id, access_request__user_id__in=missing, status='approved')
+            .values_list('access_request__user_id', 'data_type')
+            .distinct()
+        )
+        for user_id, data_type in rows:
+            fetched[user_id].add(data_type)
+        decision_cache.set_many(
+            {_pair_key(entity_id, user_id): sorted(data_types) for user_id, data_types in fetched.items()},
+            {_pair_key(entity_id, user_id): lookups[_pair_key(entity_id, user_id)][2] for user_id in missing},
+        )
+        allowed.update({user_id: frozenset(data_types) for user_id, data_types in fetched.items()})
+    return allowed
+
+
+def allowed_data_types(entity_id: int, user_id: int) -> frozenset:
+    """
+    Data types user ``user_id`` has approved for entity ``entity_id`` (cached).
+    """
+    return allowed_data_types_many(entity_id, [user_id])[int(user_id)]
+
+
+def request_decision(access_request_id: int) -> Optional[RequestDecision]:
+    """
+    The entity, user and data types per status of one access request (cached), or None if the
+    request does not exist.
+    """
+    key = _request_key(access_request_id)
+    hit, value, token = decision_cache.get_many([key])[key]
+    if hit:
+        return RequestDecision(*value)
+
+    request = AccessRequest.objects.filter(pk=access_request_id).values('entity_id', 'user_id').first()
+    if request is None:
+        return None
+    by_status = {status: [] for status, _ in STATUS_CHOICES}
+    for status, data_type in (
+        AccessRequestItem.objects.filter(access_request_id=access_request_id)
+        .order_by('id').values_list('status', 'data_type')
+    ):
+        by_status.setdefault(status, []).append(data_type)
+    decision = RequestDecision(request['entity_id'], request['user_id'], by_status)
+    decision_cache.set_many({key: tuple(decision)}, {key: token})
+    return decision
+
+
+def invalidate_items(items, pairs: bool = True):
+    """
+    Drops the cached decisions that depend on the given items, once the current transaction
+    commits. Items need their access_request loaded (or cached) when ``pairs`` is set.
+
+    :param pairs: Also drop the (entity, user) decisions; only needed when an item's status
+        or data type changed.
+    """
+    keys = set()
+    for item in items:
+        keys.add(_request_key(item.access_request_id))
+        if pairs:
+            keys.add(_pair_key(item.access_request.entity_id, item.access_request.user_id))
+    invalidate_keys(keys)
+
+
+def invalidate_access_request(access_request: AccessRequest):
+    """
+    Drops the cached decisions of an access request and its (entity, user) pair after commit,
+    and those of its previous pair if its entity or user changed since it was loaded.
+    """
+    keys = {_request_key(access_request.pk), _pair_key(access_request.entity_id, access_request.user_id)}
+    if access_request.has_changed('entity_id') or access_request.has_changed('user_id'):
+        keys.add(_pair_key(access_request.previous_value('entity_id') or access_request.entity_id,
+                           access_request.previous_value('user_id') or access_request.user_id))
+    invalidate_keys(keys)
+
+
+def invalidate_keys(keys):
+    if keys and decision_cache.enabled:
+        transaction.on_commit(lambda: decision_cache.invalidate(keys))
@@ -0,0 +1,150 @@
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from alinea_api.models import AccessRequest, AccessRequestItem, DOCUMENT_TYPE_CHOICES
+from alinea_api.services import counters
+from alinea_api.signals import notify_status_changes
+
+# Statuses an item can be moved to from 'pending'.
+DECISION_STATUSES = ('approved', 'rejected')
+
+
+class CreatedAccessRequest(NamedTuple):
+    access_request: AccessRequest
+    items: list
+
+
+class StatusChange(NamedTuple):
+    item_id: int
+    status: str
+    rejection_reason: str = None
+
+
+class StatusOutcome(NamedTuple):
+    item_id: int
+    # 'updated', 'not_found', 'not_pending', 'duplicate' or 'invalid_status'.
+    outcome: str
+    # The item's status after the call, or None if it does not exist.
+    status: str
+
+
+def _with_item_status(queryset, status):
+    # EXISTS probe on the (access_request, status) index, once per candidate request.
+    if not status:
+        return queryset
+    return queryset.filter(Exists(AccessRequestItem.objects.filter(access_request=OuterRef('pk'), status=status)))
+
+
+def entity_inbox(entity_id: int, status: str = None):
+    """
+    Access requests sent by an entity, optionally only those with an item in ``status``.
+    Ordered by AccessRequestCursorPagination, pages are range scans on the
+    (entity, requested_at, id) index.
+    """
+    queryset = (
+        AccessRequest.objects
+        .filter(entity_id=entity_id)
+        .select_related('entity', 'user')
+        .prefetch_related('items')
+    )
+    return _with_item_status(queryset, status)
+
+
+def user_access_requests(user_id: int, status: str = None):
+    """
+    Access requests addressed to a user; the user dashboard counterpart of ``entity_inbox``.
+    """
+    queryset = (
+        AccessRequest.objects
+        .filter(user_id=user_id)
+        .select_related('entity', 'user')
+        .prefetch_related('items')
+    )
+    return _with_item_status(queryset, status)
+
+
+def create_access_request(entity, user, data_types, purpose: str = '') -> CreatedAccessRequest:
+    """
+    Creates an access request and one pending item per data type, in one transaction.
+
+    The items are inserted with a single ``bulk_create``, which skips their post_save signals,
+    so the request's own ``created`` notification is the only one sent (after commit) and it
+    already lists every item.
+
+    :param data_types: Document types to request; duplicates are ignored.
+    :raises ValueError: If ``data_types`` is empty or contains an unknown document type.
+    """
+    data_types = list(dict.fromkeys(data_types))
+    valid_types = {choice for choice, _ in DOCUMENT_TYPE_CHOICES}
+    invalid = [data_type for data_type in data_types if data_type not in valid_types]
+    if invalid or not data_types:
+        raise ValueError(f"Invalid data types: {', '.join(map(str, invalid)) or 'none given'}. "
+                         f"Valid types are: {', '.join(sorted(valid_types))}.")
+
+    with transaction.atomic():
+        access_request = AccessRequest.objects.create(entity=entity, user=user, purpose=purpose)
+        items = AccessRequestItem.objects.bulk_create([
+            AccessRequestItem(access_request=access_request, data_type=data_type)
+            for data_type in data_types
+        ])
+        counters.adjust(counters.created_deltas(items))
+    for item in items:
+        item.mark_saved()
+    return CreatedAccessRequest(access_request, items)
+
+
+def set_item_statuses(changes, user=None) -> list:
+    """
+    Moves many pending AccessRequestItems to 'approved' or 'rejected' in one transaction.
+
+    The items are read with one locked SELECT and written with one ``bulk_update`` that is
+    itself restricted to pending rows, so an item decided concurrently is never overwritten.
+    Items that are missing, no longer pending, listed twice or given an invalid status are
+    reported and skipped without failing the others. Status events for the updated items are
+    sent after commit, coalesced into one event per access request.
+
+    :param changes: An iterable of StatusChange.
+    :param user: Only change items of this user's access requests; the items of other users
+        are reported as 'not_found', so their existence is not disclosed.
+    :return: A list of StatusOutcome, in the order of ``changes``.
+    """
+    changes = list(changes)
+    now = timezone.now()
+    outcomes, updated, seen = [], [], set()
+    queryset = AccessRequestItem.objects.all()
+    if user is not None:
+        queryset = queryset.filter(access_request__user=user)
+    with transaction.atomic():
+        items = (
+            queryset
+            .select_for_update(of=('self',))
+            .select_related('access_request')
+            .in_bulk([change.item_id for change in changes])
+        )
+        for change in changes:
+            item = items.get(change.item_id)
+            if change.item_id in seen:
+                outcome = 'duplicate'
+            elif change.status not in DECISION_STATUSES:
+                outcome = 'invalid_status'
+            elif item is None:
+                outcome = 'not_found'
+            elif item.status != 'pending':
+                outcome = 'not_pending'
+            else:
+                outcome = 'updated'
+                item.status = change.status
+                item.status_set_at = now
+                item.rejection_reason = change.rejection_reason if change.status == 'rejected' else None
+                updated.append(item)
+            seen.add(change.item_id)
+            outcomes.append(StatusOutcome(change.item_id, outcome, item.status if item else None))
+
+        if updated:
+            AccessRequestItem.objects.filter(status='pending').bulk_update(
+                updated, ['status', 'status_set_at', 'rejection_reason'])
+            notify_status_changes(updated)
+    return outcomes
@@ -0,0 +1,193 @@
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import BulkWriteError
+
+from alinea_api.db.mongo_client import mongo_registry
+from alinea_api.services.documents_service import (
+    BaseDocumentService,
+    BatchFetchResult,
+    BulkUpsertResult,
+    UpdateCounts,
+    UpsertResult,
+    UserPage,
+)
+
+
+class AsyncDocumentService(BaseDocumentService):
+    """
+    Async counterpart of DocumentService for consumers and async views.
+
+    Every method has the same arguments and return values as its DocumentService namesake but
+    is awaited on the event loop, using pymongo's native async client instead of a thread hop.
+    """
+
+    @property
+    def collection(self) -> AsyncCollection:
+        """
+        The user documents collection, backed by the shared async client of the running loop.
+        """
+        return mongo_registry.get_async_collection(self.collection_name, self.database_name)
+
+    async def _read_through(self, user_id, fields, fetch):
+        if not self.cache.enabled:
+            return await fetch()
+        lookup = await self.cache.aget(user_id, fields)
+        if lookup.hit:
+            return lookup.document
+        document = await fetch()
+        await self.cache.aset(user_id, fields, document, lookup.token)
+        return document
+
+    async def _versioned_write(self, user_id, document_type, query, update, expected_revision=None,
+                               array_filters=None) -> UpdateCounts:
+        try:
+            document = await self.collection.find_one_and_update(
+                update=update, array_filters=array_filters,
+                **self._versioned_write_args(query, document_type, expected_revision))
+        finally:
+            await self.cache.ainvalidate([user_id])
+        if document is not None:
+            return UpdateCounts(1, 1, self.revision_of(document, document_type))
+        if expected_revision is None:
+            return UpdateCounts(0, 0)
+        current = await self.collection.find_one(query, {"_id": 0, self.revision_field(document_type): 1})
+        if current is None:
+            return UpdateCounts(0, 0)
+        return UpdateCounts(0, 0, self.revision_of(current, document_type), conflict=True)
+
+    async def missing_indexes(self) -> list:
+        return self._missing_indexes(await self.collection.index_information())
+
+    async def ensure_indexes(self) -> list:
+        missing = await self.missing_indexes()
+        if not missing:
+            return []
+        return await self.collection.create_indexes(missing)
+
+    async def find_user_by_user_id(self, user_id: int) -> dict:
+        return await self._read_through(
+            user_id, None, lambda: self.collection.find_one(self._user_filter(user_id), self.read_projection()))
+
+    async def find_user_fields(self, user_id: int, fields, revisions: bool = False) -> dict:
+        fields = self._user_fields(fields, revisions)
+        return await self._read_through(
+            user_id, fields, lambda: self.collection.find_one(self._user_filter(user_id), self._projection(fields)))
+
+    async def find_many_by_user_ids(self, user_ids, fields=None) -> BatchFetchResult:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        fields = None if fields is None else list(fields)
+        projection = self.read_projection(fields)
+        documents, pending, lookups = {}, user_ids, {}
+        if self.cache.enabled and user_ids:
+            lookups = await self.cache.aget_many(user_ids, fields)
+            documents = {user_id: lookup.document for user_id, lookup in lookups.items() if lookup.hit}
+            pending = [user_id for user_id in user_ids if not lookups[user_id].hit]
+        if pending:
+            fetched = {
+                document['user_id']: document
+                async for document in self.collection.find(self._many_filter(pending), projection)
+            }
+            if lookups:
+                await self.cache.aset_many(
+                    fields,
+                    {user_id: fetched.get(user_id) for user_id in pending},
+                    {user_id: lookups[user_id].token for user_id in pending},
+                )
+            documents.update(fetched)
+        return self._batch_result(user_ids, documents)
+
+    async def insert_user(self, user_data: dict) -> str:
+        if 'user_id' not in user_data:
+            raise ValueError("user_data must include 'user_id' field.")
+
+        try:
+            result = await self.collection.insert_one(user_data)
+        finally:
+            await self.cache.ainvalidate([user_data['user_id']])
+        return str(result.inserted_id)
+
+    async def upsert_document(self, user_id: int, document_type: str, data: dict) -> UpsertResult:
+        try:
+            result = await self.collection.update_one(
+                self._user_filter(user_id), self._document_update(document_type, data), upsert=True)
+        finally:
+            await self.cache.ainvalidate([user_id])
+        return UpsertResult(created=result.upserted_id is not None, modified=result.modified_count > 0)
+
+    async def bulk_upsert_documents(self, entries) -> BulkUpsertResult:
+        if not entries:
+            return BulkUpsertResult(0, 0, [])
+        try:
+            result = await self.collection.bulk_write(self._bulk_upsert_requests(entries), ordered=False)
+        except BulkWriteError as e:
+            return self._bulk_write_error_result(e)
+        finally:
+            await self.cache.ainvalidate(user_id for user_id, _, _ in entries)
+        return BulkUpsertResult(result.upserted_count, result.modified_count, [])
+
+    async def update_document(self, user_id: int, document_type: str, data,
+                              expected_revision: int = None) -> UpdateCounts:
+        return await self._versioned_write(
+            user_id, document_type, self._user_filter(user_id),
+            self._document_update(document_type, data), expected_revision)
+
+    async def compare_and_set_document(self, user_id: int, document_type: str, data,
+                                       expected_revision: int) -> UpdateCounts:
+        return await self.update_document(user_id, document_type, data, expected_revision)
+
+    async def update_record(self, user_id: int, document_type: str, record_id: str, data: dict,
+                            expected_revision: int = None) -> UpdateCounts:
+        return await self._versioned_write(
+            user_id, document_type, self._record_filter(user_id, document_type, record_id),
+            self._record_update(document_type, data), expected_revision,
+            array_filters=self._record_array_filters(record_id))
+
+    async def remove_record(self, user_id: int, document_type: str, record_id: str,
+                            expected_revision: int = None) -> UpdateCounts:
+        return await self._versioned_write(
+            user_id, document_type, self._record_filter(user_id, document_type, record_id),
+            self._record_pull(document_type, record_id), expected_revision)
+
+    async def update_user(self, user_id, update_data) -> int:
+        result = await self.collection.update_one({"_id": ObjectId(user_id)}, self._user_update(update_data))
+        if self.cache.enabled and result.matched_count:
+            document = await self.collection.find_one({"_id": ObjectId(user_id)}, {"user_id": 1})
+            if document is not None:
+                await self.cache.ainvalidate([document['user_id']])
+        return result.modified_count
+
+    async def find_users(self, query: dict, limit: int = 0) -> list:
+        return await self.collection.find(query).limit(limit).to_list(None)
+
+    async def paginate_users(self, query: dict = None, fields=None, cursor: str = None,
+                             limit: int = 50) -> UserPage:
+        projection = self.read_projection(fields)
+        documents = await (
+            self.collection.find(self._page_query(query or {}, cursor), projection)
+            .sort("user_id", ASCENDING)
+            .limit(limit + 1)
+            .to_list(None)
+        )
+        return self._page_result(documents, limit)
+
+    async def iter_users(self, query: dict, projection: dict = None, batch_size: int = 500):
+        """
+        Async generator over the user documents matching a query, fetched ``batch_size`` at a time.
+        """
+        cursor = self.collection.find(query, projection, batch_size=batch_size)
+        try:
+            async for document in cursor:
+                yield document
+        finally:
+            await cursor.close()
+
+    async def delete_user(self, user_id: int) -> int:
+        try:
+            result = await self.collection.delete_one({"user_id": user_id})
+        finally:
+            await self.cache.ainvalidate([user_id])
+        return result.deleted_count
+
+
+async_document_service = AsyncDocumentService()
@@ -0,0 +1,159 @@
+import collections
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+
+from alinea_api.models import AccessRequestCounter, AccessRequestItem, STATUS_CHOICES
+
+
+def adjust(deltas):
+    """
+    Applies counter changes, creating missing counter rows. Runs in the caller's transaction.
+
+    Costs one UPDATE per changed counter; counters that do not exist yet also cost one INSERT
+    for all of them and a second UPDATE each.
+
+    :param deltas: A dict of (entity_id, data_type, status) -> change in count.
+    """
+    missing = {}
+    for (entity_id, data_type, status), delta in deltas.items():
+        if delta and not _increment(entity_id, data_type, status, delta):
+            missing[(entity_id, data_type, status)] = delta
+    if not missing:
+        return
+    # Created at zero and then incremented, so a row created concurrently is not overwritten.
+    AccessRequestCounter.objects.bulk_create(
+        [AccessRequestCounter(entity_id=entity_id, data_type=data_type, status=status)
+         for entity_id, data_type, status in missing],
+        ignore_conflicts=True,
+    )
+    for (entity_id, data_type, status), delta in missing.items():
+        _increment(entity_id, data_type, status, delta)
+
+
+def _increment(entity_id, data_type, status, delta) -> int:
+    return AccessRequestCounter.objects.filter(entity_id=entity_id, data_type=data_type, status=status) \
+        .update(count=F('count') + delta)
+
+
+def created_deltas(items) -> collections.Counter:
+    """
+    Counter changes for new items. Items need their access_request loaded (or cached).
+    """
+    deltas = collections.Counter()
+    for item in items:
+        deltas[(item.access_request.entity_id, item.data_type, item.status)] += 1
+    return deltas
+
+
+def changed_deltas(items, previous_entity_ids=None) -> collections.Counter:
+    """
+    Counter changes for items whose status, data type or access request changed since they
+    were loaded.
+
+    :param previous_entity_ids: A dict of item id -> entity id before the change, for items
+        moved to an access request of another entity.
+    """
+    previous_entity_ids = previous_entity_ids or {}
+    deltas = collections.Counter()
+    for item in items:
+        if item.has_changed('status') or item.has_changed('data_type') or item.pk in previous_entity_ids:
+            entity_id = item.access_request.entity_id
+            previous_entity_id = previous_entity_ids.get(item.pk, entity_id)
+            deltas[(previous_entity_id, item.previous_value('data_type') or item.data_type,
+                    item.previous_value('status') or item.status)] -= 1
+            deltas[(entity_id, item.data_type, item.status)] += 1
+    return deltas
+
+
+def deleted_deltas(items) -> collections.Counter:
+    """
+    Counter changes for deleted items, using their values when they were loaded.
+    """
+    deltas = collections.Counter()
+    for item in items:
+        deltas[(item.access_request.entity_id, item.previous_value('data_type') or item.data_type,
+                item.previous_value('status') or item.status)] -= 1
+    return deltas
+
+
+def request_deleted_deltas(access_request) -> collections.Counter:
+    """
+    Counter changes for deleting an access request with all its items, from one aggregate
+    query. Call it before the items are deleted.
+    """
+    deltas = collections.Counter()
+    for (data_type, status), count in _request_item_counts(access_request).items():
+        deltas[(access_request.entity_id, data_type, status)] -= count
+    return deltas
+
+
+def request_moved_deltas(access_request) -> collections.Counter:
+    """
+    Counter changes for an access request whose entity changed since it was loaded: its items
+    move from the previous entity's counters to the new one's. One aggregate query.
+    """
+    deltas = collections.Counter()
+    previous_entity_id = access_request.previous_value('entity_id')
+    for (data_type, status), count in _request_item_counts(access_request).items():
+        deltas[(previous_entity_id, data_type, status)] -= count
+        deltas[(access_request.entity_id, data_type, status)] += count
+    return deltas
+
+
+def _request_item_counts(access_request) -> dict:
+    return {
+        (row['data_type'], row['status']): row['count']
+        for row in (
+            AccessRequestItem.objects.filter(access_request_id=access_request.pk)
+            .values('data_type', 'status').annotate(count=Count('id')).order_by()
+        )
+    }
+
+
+def entity_counts(entity_id: int) -> dict:
+    """
+    Item counts of an entity per status, overall and per data type. Reads one counter row per
+    (data type, status), however many items the entity has.
+    """
+    total = {status: 0 for status, _ in STATUS_CHOICES}
+    by_data_type = {}
+    for data_type, status, count in (
+        AccessRequestCounter.objects.filter(entity_id=entity_id).values_list('data_type', 'status', 'count')
+    ):
+        total[status] = total.get(status, 0) + count
+        by_data_type.setdefault(data_type, {s: 0 for s, _ in STATUS_CHOICES})[status] = count
+    return {'total': total, 'by_data_type': by_data_type}
+
+
+def rebuild() -> int:
+    """
+    Recomputes every counter from the AccessRequestItem table in one transaction.
+
+    The counter table is locked for the whole rebuild, before the items are counted: item
+    changes committed earlier are counted, and concurrent ones wait for the rebuild and then
+    apply their change to the new counters, so none is lost.
+
+    :return: The number of counter rows written.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Conflicts with the row updates and inserts of adjust(), not with reads.
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {connection.ops.quote_name(AccessRequestCounter._meta.db_table)} '
+                               f'IN SHARE ROW EXCLUSIVE MODE')
+        # Deleting first takes the write locks (the database lock on SQLite) before counting.
+        AccessRequestCounter.objects.all().delete()
+        rows = (
+            AccessRequestItem.objects
+            .values('access_request__entity_id', 'data_type', 'status')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        counters = [
+            AccessRequestCounter(entity_id=row['access_request__entity_id'], data_type=row['data_type'],
+                                 status=row['status'], count=row['count'])
+            for row in rows
+        ]
+        AccessRequestCounter.objects.bulk_create(counters, batch_size=1000)
+    return len(counters)
@@ -0,0 +1,210 @@
+import asyncio
+import atexit
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from alinea_api.db.monitoring import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENT_SETTINGS = {
+    'COALESCE_WINDOW_MS': 200,
+    'QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 100,
+    'OVERFLOW_POLICY': 'drop_oldest',
+    'BLOCK_TIMEOUT_MS': 50,
+    'OUTBOX': False,
+}
+
+OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+
+def get_event_settings() -> dict:
+    """
+    Returns the ``ACCESS_REQUEST_EVENTS`` setting applied over the defaults.
+    """
+    return {**DEFAULT_EVENT_SETTINGS, **getattr(settings, 'ACCESS_REQUEST_EVENTS', {})}
+
+
+_STOP = object()
+
+
+class EventDispatcher:
+    """
+    Sends channel layer messages from a background thread, so that request threads never wait
+    on the channel layer (Redis).
+
+    Messages go to a bounded in-process queue. A worker thread drains it in batches and sends
+    each batch concurrently on its own long-lived event loop. When the queue is full, the
+    ``OVERFLOW_POLICY`` setting decides what happens:
+
+    - ``drop_newest``: the new message is dropped.
+    - ``drop_oldest``: the oldest queued message is dropped to make room.
+    - ``block``: the caller waits up to ``BLOCK_TIMEOUT_MS``, then the new message is dropped.
+
+    Queued messages are lost if the process dies; they are best-effort notifications.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._worker = None
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = collections.Counter()
+        self._max_depth = 0
+        self._send_latency = LatencyHistogram()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _ensure_worker(self):
+        # The worker thread does not survive a fork; each process starts its own.
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._pid == os.getpid():
+                return
+            config = get_event_settings()
+            if config['OVERFLOW_POLICY'] not in OVERFLOW_POLICIES:
+                raise ImproperlyConfigured(
+                    f"ACCESS_REQUEST_EVENTS['OVERFLOW_POLICY'] must be one of {', '.join(OVERFLOW_POLICIES)}.")
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=config['QUEUE_SIZE'])
+            with self._stats_lock:
+                self._reset_stats()
+            self._worker = threading.Thread(target=self._run, name='event-dispatcher', daemon=True)
+            self._worker.start()
+
+    def dispatch(self, group: str, message: dict) -> bool:
+        """
+        Queues ``message`` for ``channel_layer.group_send(group, message)``.
+
+        :return: Whether the message was queued (False if dropped by the overflow policy).
+        """
+        self._ensure_worker()
+        entry = (group, message)
+        config = get_event_settings()
+        try:
+            if config['OVERFLOW_POLICY'] == 'block':
+                self._queue.put(entry, timeout=config['BLOCK_TIMEOUT_MS'] / 1000.0)
+            else:
+                self._queue.put_nowait(entry)
+        except queue.Full:
+            if config['OVERFLOW_POLICY'] != 'drop_oldest' or not self._replace_oldest(entry):
+                self._count('dropped')
+                logger.warning("Event queue full, dropped event for %s", group)
+                return False
+        self._count('enqueued')
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._max_depth = max(self._max_depth, depth)
+        return True
+
+    def _replace_oldest(self, entry) -> bool:
+        try:
+            dropped_group, _ = self._queue.get_nowait()
+            self._queue.task_done()
+        except queue.Empty:
+            dropped_group = None
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            return False
+        if dropped_group is not None:
+            self._count('dropped')
+            logger.warning("Event queue full, dropped oldest event for %s", dropped_group)
+        return True
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        batch_size = get_event_settings()['BATCH_SIZE']
+        while len(batch) < batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = _STOP in batch
+                batch = [entry for entry in batch if entry is not _STOP]
+                if batch:
+                    started = time.monotonic()
+                    try:
+                        loop.run_until_complete(self._send_batch(batch))
+                    except Exception:
+                        self._count('failed', len(batch))
+                        logger.exception("Failed to send a batch of %d events", len(batch))
+                    with self._stats_lock:
+                        self._stats['batches'] += 1
+                        self._send_latency.observe((time.monotonic() - started) * 1000.0)
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            loop.close()
+
+    async def _send_batch(self, batch):
+        channel_layer = get_channel_layer()
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, message) for group, message in batch),
+            return_exceptions=True,
+        )
+        failed = 0
+        for (group, _), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                logger.error("Failed to send event to %s: %r", group, result)
+        self._count('sent', len(batch) - failed)
+        self._count('failed', failed)
+
+    def stats(self) -> dict:
+        config = get_event_settings()
+        current_process = self._pid == os.getpid()
+        with self._stats_lock:
+            stats = {key: self._stats[key] for key in ('enqueued', 'sent', 'failed', 'dropped', 'batches')}
+            stats['max_queue_depth'] = self._max_depth
+            stats['batch_send_latency'] = self._send_latency.snapshot()
+        stats.update({
+            'running': current_process and self._worker is not None and self._worker.is_alive(),
+            'queue_depth': self._queue.qsize() if current_process and self._queue is not None else 0,
+            'queue_size': config['QUEUE_SIZE'],
+            'overflow_policy': config['OVERFLOW_POLICY'],
+        })
+        return stats
+
+    def close(self, timeout: float = 5.0):
+        """
+        Sends what is queued (waiting up to ``timeout`` seconds) and stops the worker.
+        """
+        with self._lock:
+            worker, self._worker = self._worker, None
+            if worker is None or self._pid != os.getpid():
+                return
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                return
+        worker.join(timeout)
+
+
+event_dispatcher = EventDispatcher()
+atexit.register(event_dispatcher.close)
@@ -0,0 +1,273 @@
+import logging
+import threading
+import uuid
+from typing import NamedTuple
+
+import bson
+from django.core.cache import caches
+
+from alinea_api.db.mongo_client import get_mongodb_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SETTINGS = {
+    'ENABLED': False,
+    'ALIAS': 'default',
+    'TTL': 300,
+    'MAX_ENTRY_BYTES': 256 * 1024,
+}
+
+
+class CacheLookup(NamedTuple):
+    hit: bool
+    document: dict
+    # Generation token the caller must store a freshly read document under (see DocumentCache).
+    token: str
+
+
+class DocumentCache:
+    """
+    Read-through cache for user documents, keyed by user_id and the projected document types.
+
+    Every user has a generation token stored next to its cached entries, and each entry
+    remembers the token it was read under. Writes replace the token, which invalidates every
+    entry of that user at once. A reader that fetched from MongoDB before a concurrent write
+    stores its result under the old token, so it is never served afterwards.
+
+    Entries are stored BSON-encoded; documents larger than ``MAX_ENTRY_BYTES`` are not cached.
+
+    The cache is never required: when the backend fails, lookups are misses without a token
+    (so nothing is stored), and failed writes and invalidations are logged and counted as
+    ``errors``. A failed invalidation leaves entries that expire after ``TTL``.
+    """
+
+    def __init__(self, namespace: str = 'users'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'oversized': 0, 'errors': 0}
+
+    @property
+    def config(self) -> dict:
+        return {**DEFAULT_CACHE_SETTINGS, **get_mongodb_settings().get('CACHE', {})}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config['ENABLED'])
+
+    @property
+    def backend(self):
+        return caches[self.config['ALIAS']]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else None
+        stats['enabled'] = self.enabled
+        return stats
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _generation_key(self, user_id) -> str:
+        return f"documents:{self.namespace}:{int(user_id)}:generation"
+
+    def _entry_key(self, user_id, fields) -> str:
+        part = '*' if fields is None else ','.join(sorted(fields))
+        return f"documents:{self.namespace}:{int(user_id)}:{part}"
+
+    def _resolve(self, token, entry) -> CacheLookup:
+        if token is not None and entry is not None and entry[0] == token:
+            self._count('hits')
+            payload = entry[1]
+            return CacheLookup(True, None if payload is None else bson.decode(payload), token)
+        self._count('misses')
+        return CacheLookup(False, None, token)
+
+    def _encode_entry(self, document, token):
+        payload = None if document is None else bson.encode(document)
+        if payload is not None and len(payload) > self.config['MAX_ENTRY_BYTES']:
+            self._count('oversized')
+            return None
+        return token, payload
+
+    @staticmethod
+    def _new_token() -> str:
+        return uuid.uuid4().hex
+
+    def _failed(self, operation: str):
+        self._count('errors')
+        logger.warning("Document cache %s failed; falling back to MongoDB", operation, exc_info=True)
+
+    def _unavailable(self, user_ids) -> dict:
+        self._count('misses', len(user_ids))
+        return {user_id: CacheLookup(False, None, None) for user_id in user_ids}
+
+    def _seed_tokens(self, keys, values):
+        # Users without a generation token get a new one, all written with a single set_many
+        # rather than one add per user. Overwriting a token set concurrently is safe: entries
+        # are only stored under a token taken before MongoDB is read, and the new token matches
+        # none of them, so the worst case is a miss.
+        tokens, seeds = {}, {}
+        for user_id, (generation_key, _) in keys.items():
+            token = values.get(generation_key)
+            if token is None:
+                token = self._new_token()
+                seeds[generation_key] = token
+            tokens[user_id] = token
+        return tokens, seeds
+
+    def get(self, user_id, fields=None) -> CacheLookup:
+        """
+        Looks up a cached document in one cache round trip.
+
+        :param user_id: The Django user.id.
+        :param fields: The projected document types, or None for the whole document.
+        """
+        generation_key, entry_key = self._generation_key(user_id), self._entry_key(user_id, fields)
+        try:
+            values = self.backend.get_many([generation_key, entry_key])
+            token = values.get(generation_key)
+            if token is None:
+                token = self._new_token()
+                if not self.backend.add(generation_key, token, self.config['TTL']):
+                    token = self.backend.get(generation_key)
+        except Exception:
+            self._failed('get')
+            return self._unavailable([user_id])[user_id]
+        return self._resolve(token, values.get(entry_key))
+
+    def get_many(self, user_ids, fields=None) -> dict:
+        """
+        Looks up the same projection for many users in one cache round trip, plus one write
+        to seed the generation tokens of users that have none yet.
+
+        :return: A dict of user_id -> CacheLookup.
+        """
+        keys = {user_id: (self._generation_key(user_id), self._entry_key(user_id, fields)) for user_id in user_ids}
+        try:
+            values = self.backend.get_many([key for pair in keys.values() for key in pair])
+            tokens, seeds = self._seed_tokens(keys, values)
+            if seeds:
+                self.backend.set_many(seeds, self.config['TTL'])
+        except Exception:
+            self._failed('get_many')
+            return self._unavailable(keys)
+        return {user_id: self._resolve(tokens[user_id], values.get(entry_key))
+                for user_id, (_, entry_key) in keys.items()}
+
+    def set_many(self, fields, documents, tokens):
+        """
+        Stores documents read from MongoDB for many users under the tokens from ``get_many``.
+
+        :param documents: A dict of user_id -> document (None for users that do not exist).
+        :param tokens: A dict of user_id -> token.
+        """
+        entries = self._entries(fields, documents, tokens)
+        if entries:
+            try:
+                self.backend.set_many(entries, self.config['TTL'])
+            except Exception:
+                self._failed('set_many')
+
+    def _entries(self, fields, documents, tokens) -> dict:
+        entries = {}
+        for user_id, document in documents.items():
+            if tokens.get(user_id) is None:
+                continue
+            entry = self._encode_entry(document, tokens[user_id])
+            if entry is not None:
+                entries[self._entry_key(user_id, fields)] = entry
+        return entries
+
+    def set(self, user_id, fields, document, token):
+        """
+        Stores a document read from MongoDB under the token returned by the preceding ``get``.
+        """
+        if token is None:
+            return
+        entry = self._encode_entry(document, token)
+        if entry is not None:
+            try:
+                self.backend.set(self._entry_key(user_id, fields), entry, self.config['TTL'])
+            except Exception:
+                self._failed('set')
+
+    def invalidate(self, user_ids):
+        """
+        Drops every cached entry of the given users by giving each a new generation token.
+        """
+        if not self.enabled:
+            return
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        try:
+            self.backend.set_many(
+                {self._generation_key(user_id): self._new_token() for user_id in user_ids}, self.config['TTL'])
+        except Exception:
+            # The MongoDB write this follows has already happened; it must not fail because
+            # of the cache.
+            self._failed('invalidate')
+            return
+        self._count('invalidations', len(user_ids))
+
+    async def aget(self, user_id, fields=None) -> CacheLookup:
+        generation_key, entry_key = self._generation_key(user_id), self._entry_key(user_id, fields)
+        try:
+            values = await self.backend.aget_many([generation_key, entry_key])
+            token = values.get(generation_key)
+            if token is None:
+                token = self._new_token()
+                if not await self.backend.aadd(generation_key, token, self.config['TTL']):
+                    token = await self.backend.aget(generation_key)
+        except Exception:
+            self._failed('get')
+            return self._unavailable([user_id])[user_id]
+        return self._resolve(token, values.get(entry_key))
+
+    async def aget_many(self, user_ids, fields=None) -> dict:
+        keys = {user_id: (self._generation_key(user_id), self._entry_key(user_id, fields)) for user_id in user_ids}
+        try:
+            values = await self.backend.aget_many([key for pair in keys.values() for key in pair])
+            tokens, seeds = self._seed_tokens(keys, values)
+            if seeds:
+                await self.backend.aset_many(seeds, self.config['TTL'])
+        except Exception:
+            self._failed('get_many')
+            return self._unavailable(keys)
+        return {user_id: self._resolve(tokens[user_id], values.get(entry_key))
+                for user_id, (_, entry_key) in keys.items()}
+
+    async def aset_many(self, fields, documents, tokens):
+        entries = self._entries(fields, documents, tokens)
+        if entries:
+            try:
+                await self.backend.aset_many(entries, self.config['TTL'])
+            except Exception:
+                self._failed('set_many')
+
+    async def aset(self, user_id, fields, document, token):
+        if token is None:
+            return
+        entry = self._encode_entry(document, token)
+        if entry is not None:
+            try:
+                await self.backend.aset(self._entry_key(user_id, fields), entry, self.config['TTL'])
+            except Exception:
+                self._failed('set')
+
+    async def ainvalidate(self, user_ids):
+        if not self.enabled:
+            return
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        try:
+            await self.backend.aset_many(
+                {self._generation_key(user_id): self._new_token() for user_id in user_ids}, self.config['TTL'])
+        except Exception:
+            self._failed('invalidate')
+            return
+        self._count('invalidations', len(user_ids))
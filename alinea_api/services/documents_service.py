@@ -1,10 +1,59 @@
-from pymongo import MongoClient
+import base64
+import binascii
+import logging
+from typing import NamedTuple
+
+import orjson
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from pymongo.collection import Collection
-from pymongo.errors import ConnectionFailure, ConfigurationError
 from bson.objectid import ObjectId
 
+from alinea_api.db.mongo_client import mongo_registry
+from alinea_api.services.document_cache import DocumentCache
+
+logger = logging.getLogger(__name__)
+
+
+class UpsertResult(NamedTuple):
+    created: bool
+    modified: bool
+
+
+class UpdateCounts(NamedTuple):
+    matched: int
+    modified: int
+    # Revision of the document type after the write, or the current revision on a conflict.
+    revision: int = None
+    # True when an expected revision was given and the stored revision did not match it.
+    conflict: bool = False
+
+
+class BulkUpsertResult(NamedTuple):
+    created: int
+    modified: int
+    # (index into the submitted entries, error message) for every write the server rejected.
+    errors: list
 
-class DocumentService:
+
+class BatchFetchResult(NamedTuple):
+    # user_id -> document for every requested user that exists.
+    documents: dict
+    # Requested user_ids without a user document.
+    missing: list
+
+
+class UserPage(NamedTuple):
+    documents: list
+    # Opaque token for the next page, or None on the last page.
+    next_cursor: str
+
+
+class BaseDocumentService:
+    """
+    Document types, index spec and query builders shared by the sync and async services.
+    """
     VALID_DOCUMENT_TYPES = [
         'personal_info',
         'medical_info',
@@ -12,36 +61,282 @@ class DocumentService:
         'psychological_info'
     ]
 
-    def __init__(self, connection_uri: str, database_name: str):
+    # Document types stored as arrays of records keyed by ``record_id``; these are edited one
+    # record at a time with the *_record methods rather than replaced wholesale.
+    RECORD_DOCUMENT_TYPES = [
+        'medical_records',
+    ]
+
+    # Indexes the users collection is expected to have. Applied by ``ensure_indexes``
+    # (``manage.py ensure_mongo_indexes``); add secondary indexes here.
+    INDEXES = [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ]
+
+    # Bookkeeping stored inside user documents (revision counters), left out of every read.
+    INTERNAL_FIELDS = ('_revisions',)
+
+    # Index options that change what an index does; two indexes on the same keys with the same
+    # values for these are the same index, whatever their names.
+    INDEX_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds', 'collation')
+
+    def __init__(self, database_name: str = None, collection_name: str = 'users'):
         """
         Initializes the DocumentService for MongoDB interactions.
 
-        :param connection_uri: MongoDB connection URI (e.g., "mongodb://localhost:27017").
-        :param database_name: Name of the database to use.
+        The connection is not opened here: the collection is resolved from the shared client
+        registry on first use, so creating the service at import time is free.
+
+        :param database_name: Name of the database to use (defaults to ``MONGODB['DATABASE']``).
+        :param collection_name: Name of the collection holding the user documents.
+        """
+        self.database_name = database_name
+        self.collection_name = collection_name
+        self.cache = DocumentCache(collection_name)
+
+    @staticmethod
+    def _user_filter(user_id) -> dict:
+        return {"user_id": int(user_id)}
+
+    @staticmethod
+    def _projection(fields) -> dict:
+        # user_id is always included so an existing document never projects to an empty dict.
+        projection = {"_id": 0, "user_id": 1}
+        projection.update({field: 1 for field in fields})
+        return projection
+
+    @staticmethod
+    def check_fields(fields):
+        """
+        Raises ValueError unless every name is a plain top-level document key: ``_id``, internal
+        (``_``-prefixed) keys, dotted paths and ``$`` operators can not be projected by callers.
+        """
+        for field in fields:
+            if not isinstance(field, str) or not field or field.startswith('_') or '.' in field or '$' in field:
+                raise ValueError(f"Invalid field name: {field!r}.")
+
+    @classmethod
+    def read_projection(cls, fields=None) -> dict:
+        """
+        Projection for reading user documents: the given top-level fields, or everything but
+        ``INTERNAL_FIELDS`` when ``fields`` is None.
+        """
+        if fields is None:
+            return {field: 0 for field in cls.INTERNAL_FIELDS}
+        cls.check_fields(fields)
+        return cls._projection(fields)
+
+    @classmethod
+    def _user_fields(cls, fields, revisions: bool) -> list:
+        # The checked fields, plus their revision counters when asked for.
+        fields = list(fields)
+        cls.check_fields(fields)
+        if revisions:
+            fields += [cls.revision_field(field) for field in fields]
+        return fields
+
+    @staticmethod
+    def _many_filter(user_ids) -> dict:
+        return {"user_id": {"$in": list(user_ids)}}
+
+    @staticmethod
+    def _batch_result(user_ids, documents) -> BatchFetchResult:
+        found = {user_id: documents[user_id] for user_id in user_ids if documents.get(user_id) is not None}
+        return BatchFetchResult(found, [user_id for user_id in user_ids if user_id not in found])
+
+    @staticmethod
+    def encode_cursor(last_user_id: int) -> str:
+        return base64.urlsafe_b64encode(orjson.dumps({"after": last_user_id})).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> int:
+        """
+        Returns the user_id a page cursor continues after. Raises ValueError for invalid cursors.
         """
         try:
-            # Create a MongoClient
-            self.client = MongoClient(connection_uri, serverSelectionTimeoutMS=5000)
+            after = orjson.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))["after"]
+        except (binascii.Error, orjson.JSONDecodeError, UnicodeEncodeError, KeyError, TypeError):
+            raise ValueError("Invalid cursor.")
+        if isinstance(after, bool) or not isinstance(after, int):
+            raise ValueError("Invalid cursor.")
+        return after
+
+    def _page_query(self, query: dict, cursor: str) -> dict:
+        if not cursor:
+            return query
+        after = {"user_id": {"$gt": self.decode_cursor(cursor)}}
+        return {"$and": [query, after]} if query else after
+
+    def _page_result(self, documents: list, limit: int) -> UserPage:
+        # One extra document is fetched to know whether another page follows.
+        if len(documents) > limit:
+            documents = documents[:limit]
+            return UserPage(documents, self.encode_cursor(documents[-1]['user_id']))
+        return UserPage(documents, None)
+
+    @classmethod
+    def _index_signature(cls, index: dict):
+        # The server may report directions as floats and leaves out false flags (unique=False).
+        keys = tuple(
+            (field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in index['key']
+        )
+        options = tuple(
+            (option, repr(None if index.get(option) is False else index.get(option)))
+            for option in cls.INDEX_OPTIONS
+        )
+        return keys, options
+
+    @classmethod
+    def _missing_indexes(cls, existing: dict) -> list:
+        # ``existing`` is the collection's index_information(). Indexes are matched on their key
+        # spec and options, so an equivalent index created under another name (e.g. the
+        # default ``user_id_1``) counts as present and create_indexes is never asked for it.
+        present = {cls._index_signature(info) for info in existing.values()}
+        return [
+            index for index in cls.INDEXES
+            if cls._index_signature({**index.document, 'key': list(index.document['key'].items())}) not in present
+        ]
+
+    @staticmethod
+    def revision_field(document_type: str) -> str:
+        """
+        Path of the revision counter of a document type, bumped by every write to it.
+        """
+        return f"_revisions.{document_type}"
+
+    @classmethod
+    def _revision_filter(cls, document_type: str, expected_revision: int) -> dict:
+        if expected_revision == 0:
+            # Document types that were never written have no revision counter yet.
+            return {cls.revision_field(document_type): {"$exists": False}}
+        return {cls.revision_field(document_type): expected_revision}
+
+    @staticmethod
+    def revision_of(document: dict, document_type: str) -> int:
+        """
+        Revision of a document type in a (projected) user document; 0 if never written.
+        """
+        return (document.get('_revisions') or {}).get(document_type, 0)
 
-            # Test connection
-            self.client.server_info()  # Raises an exception if the connection fails
+    @classmethod
+    def _revision_increment(cls, document_types) -> dict:
+        return {"$inc": {cls.revision_field(document_type): 1 for document_type in document_types}}
 
-            # Access the specified database
-            self.database = self.client[database_name]
-            # Access the 'users' collection
-            self.collection: Collection = self.database['users']
+    @classmethod
+    def _document_update(cls, document_type: str, data) -> dict:
+        return {"$set": {document_type: data}, **cls._revision_increment([document_type])}
 
-            print(f"Connected to MongoDB database: {database_name}")
+    @staticmethod
+    def _record_filter(user_id, document_type: str, record_id: str) -> dict:
+        return {"user_id": int(user_id), f"{document_type}.record_id": record_id}
 
-        except ConnectionFailure as ce:
-            print(f"Failed to connect to MongoDB: {ce}")
-            raise
-        except ConfigurationError as conf_err:
-            print(f"Configuration error: {conf_err}")
-            raise
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            raise
+    @classmethod
+    def _record_update(cls, document_type: str, data: dict) -> dict:
+        for key in data:
+            if not key or key.startswith('$') or '.' in key:
+                raise ValueError(f"Invalid record field name: {key!r}")
+        return {
+            "$set": {f"{document_type}.$[record].{key}": value for key, value in data.items()},
+            **cls._revision_increment([document_type]),
+        }
+
+    @staticmethod
+    def _record_array_filters(record_id: str) -> list:
+        return [{"record.record_id": record_id}]
+
+    @classmethod
+    def _record_pull(cls, document_type: str, record_id: str) -> dict:
+        return {"$pull": {document_type: {"record_id": record_id}}, **cls._revision_increment([document_type])}
+
+    def _user_update(self, update_data: dict) -> dict:
+        document_types = self.VALID_DOCUMENT_TYPES + self.RECORD_DOCUMENT_TYPES
+        update = {"$set": update_data}
+        revised = [key for key in update_data if key in document_types]
+        if revised:
+            update.update(self._revision_increment(revised))
+        return update
+
+    def _versioned_write_args(self, query: dict, document_type: str, expected_revision) -> dict:
+        if expected_revision is not None:
+            query = {**query, **self._revision_filter(document_type, expected_revision)}
+        return {
+            'filter': query,
+            'projection': {"_id": 0, self.revision_field(document_type): 1},
+            'return_document': ReturnDocument.AFTER,
+        }
+
+    def _bulk_upsert_requests(self, entries) -> list:
+        return [
+            UpdateOne(self._user_filter(user_id), self._document_update(document_type, data), upsert=True)
+            for user_id, document_type, data in entries
+        ]
+
+    @staticmethod
+    def _bulk_write_error_result(error: BulkWriteError) -> BulkUpsertResult:
+        details = error.details
+        errors = [(write_error['index'], write_error['errmsg']) for write_error in details.get('writeErrors', [])]
+        return BulkUpsertResult(details.get('nUpserted', 0), details.get('nModified', 0), errors)
+
+
+class DocumentService(BaseDocumentService):
+
+    @property
+    def collection(self) -> Collection:
+        """
+        The user documents collection, backed by the process-wide pooled client.
+        """
+        return mongo_registry.get_collection(self.collection_name, self.database_name)
+
+    def _read_through(self, user_id, fields, fetch):
+        if not self.cache.enabled:
+            return fetch()
+        lookup = self.cache.get(user_id, fields)
+        if lookup.hit:
+            return lookup.document
+        document = fetch()
+        self.cache.set(user_id, fields, document, lookup.token)
+        return document
+
+    def _versioned_write(self, user_id, document_type, query, update, expected_revision=None,
+                         array_filters=None) -> UpdateCounts:
+        """
+        Applies a write that bumps the revision of ``document_type`` in one round trip, optionally
+        only if the stored revision equals ``expected_revision``. A second read is only made when
+        nothing matched, to tell a missing document from a revision conflict.
+        """
+        try:
+            document = self.collection.find_one_and_update(
+                update=update, array_filters=array_filters,
+                **self._versioned_write_args(query, document_type, expected_revision))
+        finally:
+            self.cache.invalidate([user_id])
+        if document is not None:
+            return UpdateCounts(1, 1, self.revision_of(document, document_type))
+        if expected_revision is None:
+            return UpdateCounts(0, 0)
+        current = self.collection.find_one(query, {"_id": 0, self.revision_field(document_type): 1})
+        if current is None:
+            return UpdateCounts(0, 0)
+        return UpdateCounts(0, 0, self.revision_of(current, document_type), conflict=True)
+
+    def missing_indexes(self) -> list:
+        """
+        Returns the IndexModels from ``INDEXES`` that do not exist on the collection yet.
+        """
+        return self._missing_indexes(self.collection.index_information())
+
+    def ensure_indexes(self) -> list:
+        """
+        Creates any missing indexes from ``INDEXES``. Existing indexes are left untouched,
+        so this is safe to run repeatedly.
+
+        :return: The names of the indexes that were created.
+        """
+        missing = self.missing_indexes()
+        if not missing:
+            return []
+        return self.collection.create_indexes(missing)
 
     def find_user_by_user_id(self, user_id: int) -> dict:
         """
@@ -50,7 +345,59 @@ class DocumentService:
         :param user_id: The Django user.id to search for.
         :return: The user document, or None if not found.
         """
-        return self.collection.find_one({"user_id": int(user_id)})
+        return self._read_through(
+            user_id, None, lambda: self.collection.find_one(self._user_filter(user_id), self.read_projection()))
+
+    def find_user_fields(self, user_id: int, fields, revisions: bool = False) -> dict:
+        """
+        Finds a user document by user_id, returning only the requested top-level fields.
+
+        Only the projected keys are sent by the server, so large document types that were not
+        asked for are never transferred or decoded.
+
+        :param user_id: The Django user.id to search for.
+        :param fields: Iterable of top-level keys (document types) to return.
+        :param revisions: Also return the revision counters of those fields (see ``revision_of``).
+        :return: A dict with ``user_id`` and whichever requested fields exist, or None if the
+                 user document does not exist.
+        :raises ValueError: If a field name is not a plain top-level key (see ``check_fields``).
+        """
+        fields = self._user_fields(fields, revisions)
+        return self._read_through(
+            user_id, fields, lambda: self.collection.find_one(self._user_filter(user_id), self._projection(fields)))
+
+    def find_many_by_user_ids(self, user_ids, fields=None) -> BatchFetchResult:
+        """
+        Fetches the documents of many users with a single ``$in`` query.
+
+        When the cache is enabled, cached users are served from one cache round trip and only
+        the rest are queried.
+
+        :param user_ids: Iterable of Django user.ids.
+        :param fields: Top-level keys (document types) to return, or None for whole documents.
+        :return: The documents keyed by user_id, and the user_ids that have no document.
+        """
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        fields = None if fields is None else list(fields)
+        projection = self.read_projection(fields)
+        documents, pending, lookups = {}, user_ids, {}
+        if self.cache.enabled and user_ids:
+            lookups = self.cache.get_many(user_ids, fields)
+            documents = {user_id: lookup.document for user_id, lookup in lookups.items() if lookup.hit}
+            pending = [user_id for user_id in user_ids if not lookups[user_id].hit]
+        if pending:
+            fetched = {
+                document['user_id']: document
+                for document in self.collection.find(self._many_filter(pending), projection)
+            }
+            if lookups:
+                self.cache.set_many(
+                    fields,
+                    {user_id: fetched.get(user_id) for user_id in pending},
+                    {user_id: lookups[user_id].token for user_id in pending},
+                )
+            documents.update(fetched)
+        return self._batch_result(user_ids, documents)
 
     def insert_user(self, user_data: dict) -> str:
         """
@@ -63,9 +410,113 @@ class DocumentService:
         if 'user_id' not in user_data:
             raise ValueError("user_data must include 'user_id' field.")
 
-        result = self.collection.insert_one(user_data)
+        try:
+            result = self.collection.insert_one(user_data)
+        finally:
+            self.cache.invalidate([user_data['user_id']])
         return str(result.inserted_id)
 
+    def upsert_document(self, user_id: int, document_type: str, data: dict) -> UpsertResult:
+        """
+        Sets one document type on a user, creating the user document if it does not exist.
+
+        This is a single atomic ``update_one(..., upsert=True)``, so concurrent first writes
+        for the same user cannot create duplicate user documents.
+
+        :param user_id: The Django user.id owning the document.
+        :param document_type: The document type key to set.
+        :param data: The document content.
+        :return: Whether the user document was created, and whether an existing one was modified.
+        """
+        try:
+            result = self.collection.update_one(
+                self._user_filter(user_id), self._document_update(document_type, data), upsert=True)
+        finally:
+            self.cache.invalidate([user_id])
+        return UpsertResult(created=result.upserted_id is not None, modified=result.modified_count > 0)
+
+    def bulk_upsert_documents(self, entries) -> BulkUpsertResult:
+        """
+        Upserts many (user_id, document_type, data) entries with one unordered ``bulk_write``.
+
+        Unordered writes let the server apply the batch in parallel and keep going past
+        individual failures, which are reported back by their position in ``entries``.
+
+        :param entries: A sequence of (user_id, document_type, data) tuples.
+        :return: Created/modified counts and the per-entry write errors.
+        """
+        if not entries:
+            return BulkUpsertResult(0, 0, [])
+        try:
+            result = self.collection.bulk_write(self._bulk_upsert_requests(entries), ordered=False)
+        except BulkWriteError as e:
+            return self._bulk_write_error_result(e)
+        finally:
+            self.cache.invalidate(user_id for user_id, _, _ in entries)
+        return BulkUpsertResult(result.upserted_count, result.modified_count, [])
+
+    def update_document(self, user_id: int, document_type: str, data, expected_revision: int = None) -> UpdateCounts:
+        """
+        Replaces one document type on an existing user document, without reading it first.
+
+        :param user_id: The Django user.id owning the document.
+        :param document_type: The document type key to set.
+        :param data: The new document content (None clears it).
+        :param expected_revision: If given, only write when the document type is at this revision.
+        :return: Matched/modified counts and the new revision; matched is 0 when the user
+                 document does not exist or, with ``conflict`` set, the revision did not match.
+        """
+        return self._versioned_write(
+            user_id, document_type, self._user_filter(user_id),
+            self._document_update(document_type, data), expected_revision)
+
+    def compare_and_set_document(self, user_id: int, document_type: str, data, expected_revision: int) -> UpdateCounts:
+        """
+        Replaces one document type only if its revision is still ``expected_revision``.
+
+        Fails fast instead of overwriting a concurrent edit: on a mismatch nothing is written
+        and the result has ``conflict`` set and the current revision.
+        """
+        return self.update_document(user_id, document_type, data, expected_revision)
+
+    def update_record(self, user_id: int, document_type: str, record_id: str, data: dict,
+                      expected_revision: int = None) -> UpdateCounts:
+        """
+        Updates the fields of one record in a record array (e.g. ``medical_records``) in place.
+
+        Only the given fields of the matching record are sent to the server, using ``$set``
+        with an ``arrayFilters`` match on ``record_id``. Concurrent edits to other records or
+        other fields are not overwritten.
+
+        :param user_id: The Django user.id owning the records.
+        :param document_type: The record array key, one of ``RECORD_DOCUMENT_TYPES``.
+        :param record_id: The ``record_id`` of the record to update.
+        :param data: The fields to set on the record.
+        :param expected_revision: If given, only write when the record array is at this revision.
+        :return: Matched/modified counts and the new revision; matched is 0 when the user or the
+                 record does not exist or, with ``conflict`` set, the revision did not match.
+        """
+        return self._versioned_write(
+            user_id, document_type, self._record_filter(user_id, document_type, record_id),
+            self._record_update(document_type, data), expected_revision,
+            array_filters=self._record_array_filters(record_id))
+
+    def remove_record(self, user_id: int, document_type: str, record_id: str,
+                      expected_revision: int = None) -> UpdateCounts:
+        """
+        Removes one record from a record array (e.g. ``medical_records``) with ``$pull``.
+
+        :param user_id: The Django user.id owning the records.
+        :param document_type: The record array key, one of ``RECORD_DOCUMENT_TYPES``.
+        :param record_id: The ``record_id`` of the record to remove.
+        :param expected_revision: If given, only write when the record array is at this revision.
+        :return: Matched/modified counts and the new revision; matched is 0 when the user or the
+                 record does not exist or, with ``conflict`` set, the revision did not match.
+        """
+        return self._versioned_write(
+            user_id, document_type, self._record_filter(user_id, document_type, record_id),
+            self._record_pull(document_type, record_id), expected_revision)
+
     def update_user(self, user_id, update_data):
         """
         Updates a user document in MongoDB.
@@ -76,10 +527,14 @@ class DocumentService:
         """
         result = self.collection.update_one(
             {"_id": ObjectId(user_id)},  # Convert to ObjectId if necessary
-            {"$set": update_data}  # Update the specified fields
+            self._user_update(update_data)  # Update the specified fields and their revisions
         )
-        print("Matched count:", result.matched_count)  # Debugging
-        print("Modified count:", result.modified_count)  # Debugging
+        if self.cache.enabled and result.matched_count:
+            # Cache entries are keyed by user_id, which has to be looked up from the _id.
+            document = self.collection.find_one({"_id": ObjectId(user_id)}, {"user_id": 1})
+            if document is not None:
+                self.cache.invalidate([document['user_id']])
+        logger.debug("update_user %s: matched %s, modified %s", user_id, result.matched_count, result.modified_count)
         return result.modified_count
 
     def find_users(self, query: dict, limit: int = 0) -> list:
@@ -93,6 +548,47 @@ class DocumentService:
         cursor = self.collection.find(query).limit(limit)
         return list(cursor)
 
+    def paginate_users(self, query: dict = None, fields=None, cursor: str = None,
+                       limit: int = 50) -> UserPage:
+        """
+        Returns one page of users ordered by user_id, using keyset pagination.
+
+        Each page is an index range scan on the unique user_id index starting right after the
+        previous page, so deep pages cost the same as the first one and the order is stable
+        under concurrent inserts and deletes.
+
+        :param query: Optional query filter.
+        :param fields: Optional document types to return (default: all).
+        :param cursor: The ``next_cursor`` of the previous page, or None for the first page.
+        :param limit: Maximum number of users per page.
+        :return: The page of documents and the cursor of the next page.
+        """
+        projection = self.read_projection(fields)
+        documents = list(
+            self.collection.find(self._page_query(query or {}, cursor), projection)
+            .sort("user_id", ASCENDING)
+            .limit(limit + 1)
+        )
+        return self._page_result(documents, limit)
+
+    def iter_users(self, query: dict, projection: dict = None, batch_size: int = 500):
+        """
+        Lazily yields user documents matching a query, straight from the server cursor.
+
+        Documents are fetched ``batch_size`` at a time, so memory use stays flat no matter how
+        many documents match.
+
+        :param query: A dictionary representing the query filter.
+        :param projection: Optional projection applied on the server.
+        :param batch_size: Number of documents fetched per round trip.
+        :return: A generator of user documents.
+        """
+        cursor = self.collection.find(query, projection, batch_size=batch_size)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
     def delete_user(self, user_id: int) -> int:
         """
         Deletes a user document.
@@ -100,5 +596,11 @@ class DocumentService:
         :param user_id: The Django user.id of the user to delete.
         :return: The number of documents deleted.
         """
-        result = self.collection.delete_one({"user_id": user_id})
+        try:
+            result = self.collection.delete_one({"user_id": user_id})
+        finally:
+            self.cache.invalidate([user_id])
         return result.deleted_count
+
+
+document_service = DocumentService()
@@ -0,0 +1,197 @@
+import atexit
+import contextlib
+import logging
+import threading
+
+from django.db import connections, transaction
+
+from alinea_api.models import AccessRequestItem
+from alinea_api.services.dispatch import event_dispatcher, get_event_settings
+from alinea_api.services.notifications import (
+    access_request_message,
+    entity_group_name,
+    items_status_message,
+    load_access_requests,
+    user_group_name,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EventCoalescer:
+    """
+    Collects access request changes and queues one websocket event per access request and
+    group for everything that changed within a short window. Events are handed to the
+    EventDispatcher, which sends them off the request thread.
+
+    Changes are collected per transaction and only handed to the window once it commits
+    (rolled back changes are never sent), so a transaction always lands in a single window; the
+    window only coalesces across transactions. Events are built from the rows as they are when
+    the window closes, which also collapses several updates of the same item.
+    """
+    # Connection attribute holding the changes of the connection's current transaction.
+    CONNECTION_STATE = '_access_request_event_changes'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+        # access_request_id -> whether it was created in this window.
+        self._requests = {}
+        # (entity_id, access_request_id) -> item ids with a new status.
+        self._items = {}
+
+    @property
+    def window(self) -> float:
+        return get_event_settings()['COALESCE_WINDOW_MS'] / 1000.0
+
+    def access_request_changed(self, access_request_id: int, created: bool = False):
+        """
+        Queues an access_request_event for the request's user group.
+        """
+        with self._recording() as (requests, _):
+            requests[access_request_id] = requests.get(access_request_id, False) or created
+
+    def item_status_changed(self, item: AccessRequestItem):
+        """
+        Queues an access_request_item_event for the entity group of the item's request.
+        """
+        with self._recording() as (_, items):
+            items.setdefault((item.access_request.entity_id, item.access_request_id), set()).add(item.id)
+
+    @contextlib.contextmanager
+    def _recording(self):
+        # Yields the (requests, items) changes of the current transaction. The first change of
+        # a transaction registers the one on_commit hook that hands them all to the window, so
+        # a transaction is queued (and, without a window, sent) once however much it changed.
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            changes = ({}, {})
+            yield changes
+            self._enqueue(*changes)
+            return
+        state = getattr(connection, self.CONNECTION_STATE, None)
+        # Django replaces run_on_commit with a new list whenever the hooks run or are discarded
+        # (commit, rollback, savepoint rollback), which also ends the changes recorded with it.
+        if state is None or state[0] is not connection.run_on_commit:
+            changes = ({}, {})
+            transaction.on_commit(lambda: self._commit(connection, changes))
+            state = (connection.run_on_commit, changes)
+            setattr(connection, self.CONNECTION_STATE, state)
+        yield state[1]
+
+    def _commit(self, connection, changes):
+        state = getattr(connection, self.CONNECTION_STATE, None)
+        if state is not None and state[1] is changes:
+            setattr(connection, self.CONNECTION_STATE, None)
+        self._enqueue(*changes)
+
+    def _enqueue(self, requests, items):
+        with self._lock:
+            for access_request_id, created in requests.items():
+                self._requests[access_request_id] = self._requests.get(access_request_id, False) or created
+            for key, item_ids in items.items():
+                self._items.setdefault(key, set()).update(item_ids)
+        self._schedule()
+
+    def _schedule(self):
+        window = self.window
+        if window <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(window, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own database connections.
+            connections.close_all()
+
+    def flush(self):
+        """
+        Builds and dispatches the events collected so far.
+        """
+        with self._lock:
+            requests, items = self._requests, self._items
+            self._requests, self._items, self._timer = {}, {}, None
+        try:
+            if requests:
+                self._send_request_events(requests)
+            if items:
+                self._send_item_events(items)
+        except Exception:
+            logger.exception("Failed to send access request events")
+
+    def close(self):
+        """
+        Cancels the pending window and sends what it collected. Registered to run at exit
+        (before the dispatcher drains its queue), so short-lived processes such as management
+        commands do not drop their last window of events.
+        """
+        with self._lock:
+            timer = self._timer
+        if timer is not None:
+            timer.cancel()
+        self.flush()
+
+    def _send_request_events(self, requests):
+        for group, message in build_request_events(requests).values():
+            event_dispatcher.dispatch(group, message)
+
+    def _send_item_events(self, items):
+        for group, message in build_item_events(items).values():
+            event_dispatcher.dispatch(group, message)
+
+
+def build_request_events(requests) -> dict:
+    """
+    Builds one access_request_event per access request, from the current rows.
+
+    :param requests: A dict of access_request_id -> whether it was created.
+    :return: A dict of access_request_id -> (group, message); deleted requests are left out.
+    """
+    events = {}
+    for access_request in load_access_requests(requests):
+        action = 'created' if requests[access_request.id] else 'updated'
+        events[access_request.id] = (
+            user_group_name(access_request.user_id),
+            {
+                'type': 'access_request_event',
+                'message': access_request_message(access_request, action),
+            }
+        )
+    return events
+
+
+def build_item_events(items) -> dict:
+    """
+    Builds one access_request_item_event per access request, from the current rows.
+
+    :param items: A dict of (entity_id, access_request_id) -> item ids.
+    :return: A dict of (entity_id, access_request_id) -> (group, message); keys whose items
+        were all deleted are left out.
+    """
+    loaded = AccessRequestItem.objects.in_bulk([item_id for ids in items.values() for item_id in ids])
+    events = {}
+    for (entity_id, access_request_id), item_ids in items.items():
+        current = [loaded[item_id] for item_id in sorted(item_ids) if item_id in loaded]
+        if current:
+            events[(entity_id, access_request_id)] = (
+                entity_group_name(entity_id),
+                {
+                    'type': 'access_request_item_event',
+                    'message': items_status_message(access_request_id, current),
+                }
+            )
+    return events
+
+
+event_coalescer = EventCoalescer()
+# atexit runs handlers in reverse order; the dispatcher's close was registered on import of
+# dispatch, so this flush runs first and its events are still sent.
+atexit.register(event_coalescer.close)
@@ -0,0 +1,116 @@
+import time
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from alinea_api.models import AccessRequestItem, DOCUMENT_TYPE_CHOICES
+from alinea_api.signals import notify_status_changes
+
+DEFAULT_EXPIRY_SETTINGS = {
+    'DEFAULT_DAYS': 30,
+    'ENTITY_TYPES': {},
+    'DATA_TYPES': {},
+}
+
+
+class ExpiryRule(NamedTuple):
+    data_type: str
+    # Restricts the rule to some entities; None for all of them.
+    entity_filter: Q
+    days: int
+
+
+def get_expiry_settings() -> dict:
+    """
+    Returns the ``ACCESS_REQUEST_EXPIRY`` setting applied over the defaults.
+    """
+    return {**DEFAULT_EXPIRY_SETTINGS, **getattr(settings, 'ACCESS_REQUEST_EXPIRY', {})}
+
+
+def expiry_rules() -> list:
+    """
+    Turns the expiry settings into one rule per data type, plus one per overridden entity type
+    for data types without their own setting. Rules that never expire are left out.
+    """
+    config = get_expiry_settings()
+    entity_types = config['ENTITY_TYPES']
+    rules = []
+    for data_type, _ in DOCUMENT_TYPE_CHOICES:
+        if data_type in config['DATA_TYPES']:
+            rules.append(ExpiryRule(data_type, None, config['DATA_TYPES'][data_type]))
+            continue
+        for entity_type, days in entity_types.items():
+            rules.append(ExpiryRule(data_type, Q(access_request__entity__entity_type=entity_type), days))
+        others = ~Q(access_request__entity__entity_type__in=list(entity_types)) if entity_types else None
+        rules.append(ExpiryRule(data_type, others, config['DEFAULT_DAYS']))
+    return [rule for rule in rules if rule.days is not None]
+
+
+def _expirable(rule: ExpiryRule, now):
+    # Range scan on the (status, created_at, id) index, oldest first.
+    queryset = AccessRequestItem.objects.filter(
+        status='pending', data_type=rule.data_type, created_at__lt=now - timedelta(days=rule.days))
+    if rule.entity_filter is not None:
+        queryset = queryset.filter(rule.entity_filter)
+    return queryset.order_by('created_at', 'id')
+
+
+def count_expirable(now=None) -> int:
+    now = now or timezone.now()
+    return sum(_expirable(rule, now).count() for rule in expiry_rules())
+
+
+def expire_chunk(rule: ExpiryRule, now, chunk_size: int) -> int:
+    """
+    Expires up to ``chunk_size`` items of one rule in a short transaction: one locked SELECT
+    and one UPDATE, then counters and one coalesced event per affected access request.
+
+    :return: The number of items expired.
+    """
+    with transaction.atomic():
+        items = list(
+            _expirable(rule, now)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('access_request')
+            .only('id', 'data_type', 'status', 'access_request', 'access_request__entity',
+                  'access_request__user')
+            [:chunk_size]
+        )
+        if not items:
+            return 0
+        AccessRequestItem.objects.filter(id__in=[item.id for item in items], status='pending') \
+            .update(status='expired', status_set_at=now)
+        for item in items:
+            item.status = 'expired'
+            item.status_set_at = now
+        notify_status_changes(items)
+    return len(items)
+
+
+def expire_pending_items(now=None, chunk_size: int = 500, pause: float = 0.0, max_chunks: int = None) -> int:
+    """
+    Moves every pending item past its expiry to 'expired', ``chunk_size`` items per
+    transaction so that row locks stay short.
+
+    :param pause: Seconds to sleep between chunks, to leave room for foreground writes.
+    :param max_chunks: Stop after this many chunks (None for no limit).
+    :return: The number of items expired.
+    """
+    now = now or timezone.now()
+    total, chunks = 0, 0
+    for rule in expiry_rules():
+        while max_chunks is None or chunks < max_chunks:
+            expired = expire_chunk(rule, now, chunk_size)
+            if not expired:
+                break
+            total += expired
+            chunks += 1
+            if expired < chunk_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return total
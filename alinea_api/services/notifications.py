@@ -0,0 +1,94 @@
+import orjson
+
+from alinea_api.models import AccessRequest, AccessRequestItem
+
+
+def load_access_request(access_request_id: int) -> AccessRequest:
+    """
+    Loads an access request with its entity, user and items in two queries, however many
+    items it has. Raises AccessRequest.DoesNotExist.
+    """
+    return (
+        AccessRequest.objects
+        .select_related('entity', 'user')
+        .prefetch_related('items')
+        .get(pk=access_request_id)
+    )
+
+
+def load_access_requests(access_request_ids) -> list:
+    """
+    Same as ``load_access_request`` for many requests, still in two queries.
+    """
+    return list(
+        AccessRequest.objects
+        .select_related('entity', 'user')
+        .prefetch_related('items')
+        .filter(pk__in=access_request_ids)
+    )
+
+
+def serialize_item(item: AccessRequestItem) -> dict:
+    """
+    Payload of one access request item. Only reads the item's own columns.
+    """
+    return {
+        'id': item.id,
+        'access_request_id': item.access_request_id,
+        'data_type': item.data_type,
+        'data_type_display': item.get_data_type_display(),
+        'status': item.status,
+        'status_set_at': item.status_set_at.isoformat() if item.status_set_at else None,
+        'created_at': item.created_at.isoformat() if item.created_at else None,
+    }
+
+
+def serialize_access_request(access_request: AccessRequest, items=None) -> dict:
+    """
+    Payload of an access request and its items. Expects an instance from
+    ``load_access_request``, or its items in ``items``; anything else costs extra queries.
+    """
+    return {
+        'id': access_request.id,
+        'entity_id': access_request.entity_id,
+        'entity_name': access_request.entity.name,
+        'user_id': access_request.user_id,
+        'user_username': access_request.user.username,
+        'requested_at': access_request.requested_at.isoformat(),
+        'purpose': access_request.purpose,
+        'items': [serialize_item(item) for item in (access_request.items.all() if items is None else items)],
+    }
+
+
+def encode(payload) -> str:
+    return orjson.dumps(payload).decode()
+
+
+def access_request_message(access_request: AccessRequest, action: str) -> str:
+    """
+    Encoded ``created``/``updated`` event sent to the user's group.
+    """
+    return encode({'action': action, 'access_request': serialize_access_request(access_request)})
+
+
+def items_status_message(access_request_id: int, items) -> str:
+    """
+    Encoded ``status_updated`` event sent to the entity's group for one or more items of the
+    same access request. ``access_request_item`` holds the last item, for clients that
+    predate ``access_request_items``.
+    """
+    payloads = [serialize_item(item) for item in items]
+    return encode({
+        'action': 'status_updated',
+        'access_request_id': access_request_id,
+        'access_request_items': payloads,
+        'access_request_item': payloads[-1],
+    })
+
+
+def user_group_name(user_id: int) -> str:
+    return f'user_{user_id}_group'
+
+
+def entity_group_name(entity_id: int) -> str:
+    return f'entity_{entity_id}_group'
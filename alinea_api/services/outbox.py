@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import NamedTuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from alinea_api.models import EventOutbox
+from alinea_api.services.dispatch import get_event_settings
+from alinea_api.services.events import build_item_events, build_request_events
+
+logger = logging.getLogger(__name__)
+
+
+class RelayResult(NamedTuple):
+    # Outbox rows read in this batch.
+    rows: int
+    published: int
+    failed: int
+    # Failed rows that reached the maximum number of attempts and will not be retried.
+    dead_lettered: int = 0
+
+
+def outbox_enabled() -> bool:
+    return bool(get_event_settings()['OUTBOX'])
+
+
+def record_access_request(access_request_id: int, created: bool = False):
+    """
+    Writes an access_request_event for the request's user group to the outbox. Runs in the
+    caller's transaction.
+    """
+    EventOutbox.objects.create(
+        kind='access_request_created' if created else 'access_request_updated',
+        access_request_id=access_request_id,
+    )
+
+
+def record_item_statuses(items):
+    """
+    Writes status events for AccessRequestItems to the outbox with one INSERT. Load the items
+    with ``select_related('access_request')`` to avoid a query per item.
+    """
+    EventOutbox.objects.bulk_create([
+        EventOutbox(
+            kind='item_status',
+            access_request_id=item.access_request_id,
+            entity_id=item.access_request.entity_id,
+            item_id=item.id,
+        )
+        for item in items
+    ])
+
+
+async def _publish(events: dict) -> set:
+    # Returns the keys of the events the channel layer did not accept.
+    channel_layer = get_channel_layer()
+    keys = list(events)
+    results = await asyncio.gather(
+        *(channel_layer.group_send(*events[key]) for key in keys),
+        return_exceptions=True,
+    )
+    failed = set()
+    for key, result in zip(keys, results):
+        if isinstance(result, BaseException):
+            logger.error("Failed to publish outbox event to %s: %r", events[key][0], result)
+            failed.add(key)
+    return failed
+
+
+def claim_batch(batch_size: int, lease_seconds: float) -> list:
+    """
+    Claims the oldest unpublished outbox rows for ``lease_seconds``, in a short transaction.
+
+    Rows are selected with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports
+    it and marked claimed, so several relays can run side by side without publishing the same
+    rows. The claim of a relay that dies lapses after the lease, and its rows are claimed again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            EventOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(published_at__isnull=True, dead_lettered_at__isnull=True)
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+            .order_by('id')[:batch_size]
+        )
+        if rows:
+            EventOutbox.objects.filter(id__in=[row.id for row in rows]) \
+                .update(claimed_until=now + timedelta(seconds=lease_seconds))
+    return rows
+
+
+def _publish_rows(rows) -> set:
+    # Returns the ids of the rows whose event the channel layer did not accept.
+    requests, items, row_keys = {}, {}, {}
+    for row in rows:
+        if row.kind == 'item_status':
+            key = ('item', (row.entity_id, row.access_request_id))
+            items.setdefault(key[1], set()).add(row.item_id)
+        else:
+            key = ('request', row.access_request_id)
+            requests[row.access_request_id] = (
+                requests.get(row.access_request_id, False) or row.kind == 'access_request_created')
+        row_keys[row.id] = key
+
+    events = {('request', key): event for key, event in build_request_events(requests).items()}
+    events.update({('item', key): event for key, event in build_item_events(items).items()})
+    failed_keys = async_to_sync(_publish)(events) if events else set()
+    # Rows whose requests or items were deleted have no event and count as published.
+    return {row.id for row in rows if row_keys[row.id] in failed_keys}
+
+
+def relay_batch(batch_size: int = 100, max_attempts: int = 10, lease_seconds: float = 60.0) -> RelayResult:
+    """
+    Publishes the oldest unpublished outbox rows, coalesced into one event per access request
+    and group, and marks them published once the channel layer accepted them.
+
+    The rows are claimed first (see ``claim_batch``) and published outside of any transaction,
+    so no row lock is held while waiting on the channel layer. Delivery is at least once: a
+    crash between publishing and marking the rows, or a publish slower than the lease,
+    publishes them again. Failed rows are retried by the next batch until they have failed
+    ``max_attempts`` times, then dead-lettered so they cannot hold up the rows behind them.
+    """
+    rows = claim_batch(batch_size, lease_seconds)
+    if not rows:
+        return RelayResult(0, 0, 0)
+
+    try:
+        failed = _publish_rows(rows)
+    except Exception:
+        logger.exception("Failed to build or publish %d outbox events", len(rows))
+        failed = {row.id for row in rows}
+
+    published = [row.id for row in rows if row.id not in failed]
+    if published:
+        EventOutbox.objects.filter(id__in=published).update(published_at=timezone.now(), claimed_until=None)
+    dead_lettered = 0
+    if failed:
+        EventOutbox.objects.filter(id__in=failed).update(attempts=F('attempts') + 1, claimed_until=None)
+        dead_lettered = EventOutbox.objects.filter(id__in=failed, attempts__gte=max_attempts) \
+            .update(dead_lettered_at=timezone.now())
+        if dead_lettered:
+            logger.error("Dead-lettered %d outbox rows after %d failed attempts", dead_lettered, max_attempts)
+    return RelayResult(len(rows), len(published), len(failed), dead_lettered)
+
+
+def purge_published(older_than) -> int:
+    """
+    Deletes outbox rows published before ``older_than``.
+    """
+    deleted, _ = EventOutbox.objects.filter(published_at__lt=older_than).delete()
+    return deleted
@@ -1,102 +1,117 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from .models import AccessRequest, AccessRequestItem
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.db import transaction
-import json
+from .models import AccessRequest, AccessRequestItem, Entity
+from .services import access_decisions, counters
+from .services.events import event_coalescer
+from .services.outbox import outbox_enabled, record_access_request, record_item_statuses
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Websocket events either go to the EventOutbox table, in the transaction of the change, or
+# through the in-process coalescer, which sends one event per access request and group for all
+# the changes committed within its window (see ACCESS_REQUEST_EVENTS['OUTBOX']).
+
+def access_request_changed(access_request_id, created=False):
+    if outbox_enabled():
+        record_access_request(access_request_id, created)
+    else:
+        event_coalescer.access_request_changed(access_request_id, created)
+
 @receiver(post_save, sender=AccessRequest)
 def handle_access_request_save(sender, instance, created, **kwargs):
-    transaction.on_commit(lambda: send_access_request_notification(instance, created))
+    if not created:
+        if instance.has_changed('entity_id'):
+            # Runs in the transaction of AccessRequest.save, like the item counters.
+            counters.adjust(counters.request_moved_deltas(instance))
+        access_decisions.invalidate_access_request(instance)
+    access_request_changed(instance.pk, created)
 
-def send_access_request_notification(instance, created):
+@receiver(post_save, sender=AccessRequestItem)
+def handle_access_request_item_update(sender, instance, created, **kwargs):
+    # Runs in the transaction of AccessRequestItem.save, so counters stay exact.
     if created:
-        action = 'created'
-        print(f'New AccessRequest created: "{instance}"')
-    else:
-        action = 'updated'
-        print(f'AccessRequest updated: "{instance}"')
-    items = AccessRequestItem.objects.filter(access_request=instance.id)
-    item_data_list = []
-    for item in items:
-        item_data = {
-            'id': item.id,
-            'access_request_id': item.access_request.id,
-            'data_type': item.data_type,
-            'data_type_display': item.get_data_type_display(),
-            'approved': item.approved,
-            'approved_at': item.approved_at.isoformat() if item.approved_at else None,
-        }
-        item_data_list.append(item_data)
+        counters.adjust(counters.created_deltas([instance]))
+        # Items can be created already approved, which changes what the entity may read.
+        access_decisions.invalidate_items([instance], pairs=instance.status == 'approved')
+        # Lets the user's event for a new request include the items created with it.
+        access_request_changed(instance.access_request_id)
+        return
+    # The previous values come from the ones captured when the item was loaded
+    # (AccessRequestItem.from_db), so detecting a transition costs no query.
+    reassigned = instance.has_changed('access_request_id')
+    if not (instance.has_changed('status') or instance.has_changed('data_type') or reassigned):
+        return
+    _load_access_request(instance)
+    previous = _previous_access_request(instance) if reassigned else None
+    counters.adjust(counters.changed_deltas(
+        [instance], {instance.pk: previous.entity_id} if previous is not None else None))
+    access_decisions.invalidate_items([instance])
+    if previous is not None:
+        # The item also left its previous request, and what that request's pair may read.
+        access_decisions.invalidate_access_request(previous)
+    if instance.has_changed('status'):
+        if outbox_enabled():
+            record_item_statuses([instance])
+        else:
+            event_coalescer.item_status_changed(instance)
 
-    # Prepare the message payload
-    message = {
-        'action': action,
-        'access_request': {
-            'id': instance.id,
-            'entity_id': instance.entity.id,
-            'entity_name': instance.entity.name,
-            'user_id': instance.user.id,
-            'user_username': instance.user.username,
-            'requested_at': instance.requested_at.isoformat(),
-            'purpose': instance.purpose,
-            'items': item_data_list,
-        }
-    }
+def _load_access_request(item):
+    # Counters, decisions and events need the request's entity and user. Items saved on their
+    # own usually come without their request, so only those two columns are read, once.
+    if not AccessRequestItem.access_request.is_cached(item):
+        item.access_request = AccessRequest.objects.only('entity', 'user').get(pk=item.access_request_id)
 
-    # Get the user's group name
-    user_id = instance.user.id
-    group_name = f'user_{user_id}_group'
+def _previous_access_request(item):
+    # The request an item was moved away from (its entity and user only), or None if it is gone.
+    return AccessRequest.objects.only('entity', 'user').filter(pk=item.previous_value('access_request_id')).first()
 
-    # Get the channel layer
-    channel_layer = get_channel_layer()
+def _origin_model(origin):
+    # The model a delete was started from, given the ``origin`` of a delete signal (an
+    # instance or a queryset); None when unknown.
+    if origin is None:
+        return None
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
 
-    # Send message to the user's group
-    async_to_sync(channel_layer.group_send)(
-        group_name,
-        {
-            'type': 'access_request_event',
-            'message': json.dumps(message),
-        }
-    )
+@receiver(pre_delete, sender=AccessRequest)
+def handle_access_request_pre_delete(sender, instance, origin=None, **kwargs):
+    # Takes the counters of all the request's items down at once, before they are cascaded.
+    # Deleting the entity deletes its counters too, so there is nothing to adjust then.
+    if _origin_model(origin) is not Entity:
+        counters.adjust(counters.request_deleted_deltas(instance))
 
-@receiver(pre_save, sender=AccessRequestItem)
-def access_request_item_pre_save(sender, instance, **kwargs):
-    if instance.pk:
-        previous = AccessRequestItem.objects.get(pk=instance.pk)
-        instance._previous_status = previous.status
-    else:
-        instance._previous_status = None
+@receiver(post_delete, sender=AccessRequest)
+def handle_access_request_delete(sender, instance, **kwargs):
+    # Also covers the items deleted with the request, which skip their own invalidation.
+    access_decisions.invalidate_access_request(instance)
 
-@receiver(post_save, sender=AccessRequestItem)
-def handle_access_request_item_update(sender, instance, created, **kwargs):
-    if not created and hasattr(instance, '_previous_status'):
-        if instance.status != instance._previous_status:
-            item_data = {
-                'id': instance.id,
-                'access_request_id': instance.access_request.id,
-                'data_type': instance.data_type,
-                'data_type_display': instance.get_data_type_display(),
-                'status': instance.status,
-                'status_set_at': instance.status_set_at.isoformat() if instance.status_set_at else None,
-                'created_at': instance.created_at.isoformat() if instance.created_at else None,
-            }
-            message = {
-                'action': 'status_updated',
-                'access_request_item': item_data,
-            }
-            entity_id = instance.access_request.entity.id
-            group_name = f'entity_{entity_id}_group'
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    'type': 'access_request_item_event',
-                    'message': json.dumps(message),
-                }
-            )
-            print(f"Sent event to group: {group_name}")
\ No newline at end of file
+@receiver(post_delete, sender=AccessRequestItem)
+def handle_access_request_item_delete(sender, instance, origin=None, **kwargs):
+    # Items cascaded from their access request (or its entity or user) are handled by the
+    # request's handlers; their counters may already be gone and their access request can no
+    # longer be loaded.
+    if _origin_model(origin) not in (None, AccessRequestItem):
+        return
+    counters.adjust(counters.deleted_deltas([instance]))
+    access_decisions.invalidate_items([instance])
+
+
+def notify_status_changes(items):
+    """
+    Does what the post_save handler does for items written with ``bulk_update``, which
+    bypasses it: updates the counters, invalidates cached access decisions, queues
+    status_updated events, then marks the items as saved. Call it in the transaction of the
+    update, with the items loaded with ``select_related('access_request')`` to avoid a query
+    per item.
+    """
+    counters.adjust(counters.changed_deltas(items))
+    changed = [item for item in items if item.has_changed('status')]
+    access_decisions.invalidate_items(changed)
+    if changed and outbox_enabled():
+        record_item_statuses(changed)
+    else:
+        for item in changed:
+            event_coalescer.item_status_changed(item)
+    for item in items:
+        item.mark_saved()
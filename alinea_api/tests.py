@@ -0,0 +1,330 @@
+import re
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from alinea_api.models import AccessRequest, AccessRequestCounter, AccessRequestItem, Entity
+from alinea_api.pagination import AccessRequestCursorPagination, AccessRequestItemCursorPagination
+from alinea_api.services import counters
+from alinea_api.services.access_decisions import allowed_data_types, request_decision
+from alinea_api.services.access_requests import (
+    StatusChange, create_access_request, entity_inbox, set_item_statuses, user_access_requests,
+)
+from alinea_api.services.dispatch import event_dispatcher
+from alinea_api.services.documents_service import BatchFetchResult, document_service
+from alinea_api.views.access_request import AccessRequestViewSet
+from alinea_api.views.access_request_item import AccessRequestItemViewSet
+
+# Plan lines that mean a table is read in full, per database vendor.
+FULL_SCAN_PATTERNS = {
+    # SQLite: "SCAN table" without an index (SEARCH or SCAN ... USING INDEX are index scans).
+    'sqlite': re.compile(r'\bSCAN (?!.*\bUSING (?:COVERING )?INDEX\b)'),
+    'postgresql': re.compile(r'\bSeq Scan on\b'),
+}
+
+
+def _paged(queryset, pagination_class):
+    # The first page exactly as the cursor paginator queries it.
+    return queryset.order_by(*pagination_class.ordering)[:pagination_class.page_size + 1]
+
+
+class AccessRequestQueryPlanTests(TestCase):
+    """
+    The access request inbox/dashboard queries must stay on an index: a plan that reads a
+    whole table means an index was dropped or a query stopped matching it.
+    """
+
+    def setUp(self):
+        self.full_scan = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if self.full_scan is None:
+            self.skipTest(f"Query plan checks are not supported on {connection.vendor}.")
+        if connection.vendor == 'postgresql':
+            # Small test tables make sequential scans look cheapest; only index-less plans
+            # should fall back to them. Each test runs in a transaction, which scopes this.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndexes(self, queryset):
+        plan = queryset.explain()
+        full_scans = [line for line in plan.splitlines() if self.full_scan.search(line)]
+        self.assertEqual(full_scans, [], f"Full table scan in:\n{plan}")
+
+    def test_entity_inbox(self):
+        self.assertUsesIndexes(_paged(entity_inbox(1), AccessRequestCursorPagination))
+
+    def test_entity_inbox_by_status(self):
+        self.assertUsesIndexes(_paged(entity_inbox(1, 'pending'), AccessRequestCursorPagination))
+
+    def test_user_access_requests(self):
+        self.assertUsesIndexes(_paged(user_access_requests(1), AccessRequestCursorPagination))
+
+    def test_access_request_listing(self):
+        self.assertUsesIndexes(_paged(AccessRequestViewSet.queryset.all(), AccessRequestCursorPagination))
+
+    def test_item_listing(self):
+        self.assertUsesIndexes(_paged(AccessRequestItemViewSet.queryset.all(), AccessRequestItemCursorPagination))
+
+    def test_items_of_a_request_by_status(self):
+        self.assertUsesIndexes(AccessRequestItem.objects.filter(access_request_id=1, status='pending'))
+
+    def test_items_by_status(self):
+        self.assertUsesIndexes(_paged(AccessRequestItem.objects.filter(status='pending'),
+                                      AccessRequestItemCursorPagination))
+
+
+class DocumentAdminEndpointTests(TestCase):
+    """
+    The endpoints that read or write every user's documents are for staff only; permissions
+    are checked before MongoDB is touched.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def assertRejected(self, method, url_name, user=None, **kwargs):
+        if user is not None:
+            self.client.force_authenticate(user)
+        response = getattr(self.client, method)(reverse(url_name), **kwargs)
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_import_requires_authentication(self):
+        self.assertRejected('post', 'document_import', data=b'{}\n', content_type='application/x-ndjson')
+
+    def test_import_requires_staff(self):
+        user = get_user_model().objects.create_user('patient', password='secret')
+        self.assertRejected('post', 'document_import', user, data=b'{}\n', content_type='application/x-ndjson')
+
+    def test_page_requires_authentication(self):
+        self.assertRejected('get', 'document_page')
+
+    def test_page_requires_staff(self):
+        user = get_user_model().objects.create_user('patient', password='secret')
+        self.assertRejected('get', 'document_page', user)
+
+    def test_export_requires_authentication(self):
+        self.assertRejected('get', 'document_export')
+
+    def test_export_requires_staff(self):
+        user = get_user_model().objects.create_user('patient', password='secret')
+        self.assertRejected('get', 'document_export', user)
+
+
+class DocumentBatchTests(TestCase):
+    """
+    The batch endpoint returns only the document types each user approved for the entity.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.entity = Entity.objects.create(name='Clinic', entity_type='clinic')
+        self.patient = get_user_model().objects.create_user('patient', password='secret')
+        self.other = get_user_model().objects.create_user('other', password='secret')
+        access_request = AccessRequest.objects.create(entity=self.entity, user=self.patient)
+        AccessRequestItem.objects.create(access_request=access_request, data_type='personal_info', status='approved')
+        AccessRequestItem.objects.create(access_request=access_request, data_type='medical_info', status='pending')
+
+    def get(self, **params):
+        return self.client.get(reverse('document_batch'), params)
+
+    def test_requires_authentication(self):
+        response = self.get(entity_id=self.entity.id, user_ids=str(self.patient.id))
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_returns_only_approved_document_types(self):
+        self.client.force_authenticate(self.other)
+        stored = {
+            'user_id': self.patient.id,
+            'personal_info': {'first_name': 'John'},
+            'medical_info': {'allergies': []},
+        }
+        with mock.patch.object(document_service, 'find_many_by_user_ids',
+                               return_value=BatchFetchResult({self.patient.id: stored}, [])) as find:
+            response = self.get(entity_id=self.entity.id, user_ids=f'{self.patient.id},{self.other.id}')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        find.assert_called_once_with([self.patient.id], ['personal_info'])
+        self.assertEqual(response.json(), {
+            'data': {str(self.patient.id): {'user_id': self.patient.id, 'personal_info': {'first_name': 'John'}}},
+            'missing': [self.other.id],
+        })
+
+    def test_requires_entity(self):
+        self.client.force_authenticate(self.other)
+        response = self.get(user_ids=str(self.patient.id))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DocumentDetailTests(TestCase):
+
+    def test_rejects_unknown_document_types(self):
+        # Internal keys such as _revisions are not document types and never reach MongoDB.
+        for document_type in ('_revisions', 'unknown'):
+            with self.subTest(document_type=document_type):
+                response = APIClient().get(reverse('document_detail', args=[1, document_type]))
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AccessRequestItemSaveTests(TestCase):
+
+    def setUp(self):
+        self.entity = Entity.objects.create(name='Clinic', entity_type='clinic')
+        self.patient = get_user_model().objects.create_user('patient', password='secret')
+        access_request = AccessRequest.objects.create(entity=self.entity, user=self.patient)
+        self.item = AccessRequestItem.objects.create(access_request=access_request, data_type='personal_info')
+        # Both counter rows exist, so the status change costs exactly one UPDATE per counter.
+        AccessRequestItem.objects.create(access_request=access_request, data_type='personal_info', status='approved')
+
+    def test_status_change_queries(self):
+        item = AccessRequestItem.objects.get(pk=self.item.pk)
+        item.status = 'approved'
+        # The item UPDATE, the request's entity and user, and the two counter UPDATEs.
+        with self.assertNumQueries(4):
+            item.save()
+        counts = dict(AccessRequestCounter.objects.filter(entity=self.entity).values_list('status', 'count'))
+        self.assertEqual(counts, {'pending': 0, 'approved': 2})
+
+    def test_save_without_tracked_changes_queries(self):
+        item = AccessRequestItem.objects.get(pk=self.item.pk)
+        with self.assertNumQueries(1):
+            item.save()
+
+
+@override_settings(ACCESS_REQUEST_EVENTS={'COALESCE_WINDOW_MS': 0, 'OUTBOX': False})
+class EventCoalescingTests(TestCase):
+    """
+    Without a coalescing window, each committed transaction still sends one event per access
+    request and group.
+    """
+
+    def setUp(self):
+        self.entity = Entity.objects.create(name='Clinic', entity_type='clinic')
+        patient = get_user_model().objects.create_user('patient', password='secret')
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(event_dispatcher, 'dispatch'):
+            self.created = create_access_request(
+                self.entity, patient, ['personal_info', 'medical_info', 'dental_questionnaire'])
+
+    def test_one_item_event_per_request(self):
+        changes = [StatusChange(item.id, 'approved') for item in self.created.items]
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch.object(event_dispatcher, 'dispatch') as dispatch:
+            set_item_statuses(changes)
+
+        self.assertEqual(dispatch.call_count, 1)
+        group, message = dispatch.call_args.args
+        self.assertEqual(group, f'entity_{self.entity.id}_group')
+        self.assertEqual(message['type'], 'access_request_item_event')
+
+
+class BulkItemStatusTests(TestCase):
+    """
+    Users can only decide the items of their own access requests.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        entity = Entity.objects.create(name='Clinic', entity_type='clinic')
+        self.patient = get_user_model().objects.create_user('patient', password='secret')
+        self.other = get_user_model().objects.create_user('other', password='secret')
+        self.item = create_access_request(entity, self.patient, ['personal_info']).items[0]
+
+    def post(self, item_status='approved'):
+        return self.client.post(reverse('set_access_request_item_statuses'),
+                                {'items': [{'item_id': self.item.id, 'status': item_status}]}, format='json')
+
+    def test_requires_authentication(self):
+        response = self.post()
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_owner_can_decide(self):
+        self.client.force_authenticate(self.patient)
+        response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'item_id': self.item.id, 'outcome': 'updated', 'status': 'approved'}])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.status, 'approved')
+
+    def test_items_of_other_users_are_not_found(self):
+        self.client.force_authenticate(self.other)
+        response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'item_id': self.item.id, 'outcome': 'not_found', 'status': None}])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.status, 'pending')
+
+
+@override_settings(ACCESS_DECISIONS={'CACHE_ENABLED': True, 'CACHE_ALIAS': 'default', 'TTL': 300})
+class ItemReassignmentTests(TestCase):
+    """
+    Moving an item to another access request changes the decisions of both requests and of
+    both (entity, user) pairs.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.entities = [Entity.objects.create(name=name, entity_type='clinic') for name in ('First', 'Second')]
+        users = [get_user_model().objects.create_user(name, password='secret') for name in ('first', 'second')]
+        self.requests = [AccessRequest.objects.create(entity=entity, user=user)
+                         for entity, user in zip(self.entities, users)]
+        self.item = AccessRequestItem.objects.create(
+            access_request=self.requests[0], data_type='personal_info', status='approved')
+
+    def approved(self):
+        return [
+            (request_decision(access_request.id).data_types_by_status['approved'],
+             allowed_data_types(access_request.entity_id, access_request.user_id))
+            for access_request in self.requests
+        ]
+
+    def test_reassignment_invalidates_both_requests(self):
+        # Cache the decisions before the move.
+        self.assertEqual(self.approved(), [(['personal_info'], {'personal_info'}), ([], set())])
+
+        item = AccessRequestItem.objects.get(pk=self.item.pk)
+        item.access_request_id = self.requests[1].id
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+        self.assertEqual(self.approved(), [([], set()), (['personal_info'], {'personal_info'})])
+
+
+class CounterMoveTests(TestCase):
+    """
+    Counters follow items to another entity, whether their access request or the item itself
+    was moved, and stay equal to a rebuild from the items.
+    """
+
+    def setUp(self):
+        self.entities = [Entity.objects.create(name=name, entity_type='clinic') for name in ('First', 'Second')]
+        self.patient = get_user_model().objects.create_user('patient', password='secret')
+        self.created = create_access_request(self.entities[0], self.patient, ['personal_info', 'medical_info'])
+        set_item_statuses([StatusChange(self.created.items[0].id, 'approved')])
+
+    def assertCountersMatchRebuild(self):
+        def counts():
+            return set(AccessRequestCounter.objects.exclude(count=0)
+                       .values_list('entity_id', 'data_type', 'status', 'count'))
+        maintained = counts()
+        counters.rebuild()
+        self.assertEqual(maintained, counts())
+
+    def test_access_request_moved_to_another_entity(self):
+        access_request = AccessRequest.objects.get(pk=self.created.access_request.pk)
+        access_request.entity = self.entities[1]
+        access_request.save()
+        self.assertEqual(counters.entity_counts(self.entities[0].id)['total']['approved'], 0)
+        self.assertCountersMatchRebuild()
+
+    def test_item_moved_to_a_request_of_another_entity(self):
+        other = create_access_request(self.entities[1], self.patient, ['dental_questionnaire'])
+        item = AccessRequestItem.objects.get(pk=self.created.items[0].pk)
+        item.access_request = other.access_request
+        item.save()
+        self.assertEqual(counters.entity_counts(self.entities[1].id)['total']['approved'], 1)
+        self.assertCountersMatchRebuild()
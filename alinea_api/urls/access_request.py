@@ -3,7 +3,7 @@ from rest_framework import routers
 
 from ..views.access_request import AccessRequestViewSet
 from ..views.access_request_item import AccessRequestItemViewSet, set_access_request_item_status, \
-    get_access_request_items
+    get_access_request_items, set_access_request_item_statuses
 
 
 router = routers.DefaultRouter()
@@ -16,6 +16,7 @@ urlpatterns = [
     path('set_access_request_item_status/', set_access_request_item_status, name='set_access_request_item_status'),
     path('access_request_items/', get_access_request_items, name='get_access_request_items'),
     path('access_request_itme/status/', set_access_request_item_status, name='approve_access_request_item'),
+    path('access_request_items/status/bulk/', set_access_request_item_statuses, name='set_access_request_item_statuses'),
     path('access_request_items/', get_access_request_items, name='get_access_request_items'),
 
 ]
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from ..views.metrics import EventMetricsView, MongoMetricsView
+
+urlpatterns = [
+    path('mongo/', MongoMetricsView.as_view(), name='mongo_metrics'),
+    path('events/', EventMetricsView.as_view(), name='event_metrics'),
+]
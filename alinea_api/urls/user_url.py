@@ -1,12 +1,17 @@
 # your_app/urls.py
 
 from django.urls import path
-from ..views.document import DocumentListView, DocumentDetailView, DocumentByRequestIDView
+from ..views.document import DocumentListView, DocumentDetailView, DocumentByRequestIDView, \
+    DocumentImportView, DocumentExportView, DocumentBatchView, DocumentPageView
 
 urlpatterns = [
 
     path('<int:user_id>/documents/', DocumentListView.as_view(), name='document_list'),
     path('<int:user_id>/documents/<str:document_type>/', DocumentDetailView.as_view(), name='document_detail'),
+    path('documents/', DocumentPageView.as_view(), name='document_page'),
+    path('documents/batch/', DocumentBatchView.as_view(), name='document_batch'),
+    path('documents/import/', DocumentImportView.as_view(), name='document_import'),
+    path('documents/export/', DocumentExportView.as_view(), name='document_export'),
     path('access-requests/<int:access_request_id>/documents/', DocumentByRequestIDView.as_view(), name='documents_by_request_id'),
 ]
 
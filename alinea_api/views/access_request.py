@@ -1,13 +1,43 @@
-from rest_framework import viewsets, permissions
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
 from alinea_api.models import AccessRequest
-from alinea_api.serializers import AccessRequestSerializer
+from alinea_api.pagination import AccessRequestCursorPagination
+from alinea_api.renderers import ORJSONRenderer
+from alinea_api.serializers import AccessRequestSerializer, AccessRequestWithItemsSerializer
+from alinea_api.services.access_requests import create_access_request
+from alinea_api.services.notifications import serialize_access_request
 
 
 class AccessRequestViewSet(viewsets.ModelViewSet):
     queryset = AccessRequest.objects.all()
     serializer_class = AccessRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AccessRequestCursorPagination
 
     def perform_create(self, serializer):
         serializer.save(entity=self.request.user.entity)
+
+    @swagger_auto_schema(
+        request_body=AccessRequestWithItemsSerializer,
+        operation_summary="Create an access request with its items",
+        operation_description=(
+            "Creates the access request and one pending item per data type in a single "
+            "transaction, and notifies the user once, after commit."
+        ),
+        responses={201: 'The created access request and its items', 400: 'Invalid input'},
+    )
+    @action(detail=False, methods=['post'], url_path='with-items',
+            serializer_class=AccessRequestWithItemsSerializer, renderer_classes=[ORJSONRenderer])
+    def create_with_items(self, request):
+        serializer = AccessRequestWithItemsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created = create_access_request(
+            serializer.validated_data['entity'],
+            serializer.validated_data['user'],
+            serializer.validated_data['data_types'],
+            serializer.validated_data['purpose'],
+        )
+        return Response(serialize_access_request(*created), status=status.HTTP_201_CREATED)
@@ -1,19 +1,27 @@
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import viewsets, permissions
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
 
 from alinea_api.models import AccessRequestItem, AccessRequest
+from alinea_api.pagination import AccessRequestItemCursorPagination
 from alinea_api.serializers import AccessRequestItemSerializer
+from alinea_api.services.access_requests import StatusChange, set_item_statuses
+from alinea_api.services.notifications import encode, load_access_request, serialize_item
+
+# Maximum number of items one bulk status call can change.
+MAX_BULK_STATUS_ITEMS = 500
 
 
 class AccessRequestItemViewSet(viewsets.ModelViewSet):
     queryset = AccessRequestItem.objects.all()
     serializer_class = AccessRequestItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AccessRequestItemCursorPagination
 
 
 @swagger_auto_schema(method='get', manual_parameters=[
@@ -28,22 +36,12 @@ def get_access_request_items(request):
         return HttpResponseBadRequest('Missing access_request_id parameter.')
 
     try:
-        access_request = AccessRequest.objects.get(id=access_request_id)
-    except AccessRequest.DoesNotExist:
+        access_request = load_access_request(access_request_id)
+    except (AccessRequest.DoesNotExist, ValueError):
         return JsonResponse({'error': 'AccessRequest not found.'}, status=404)
 
-    items = AccessRequestItem.objects.filter(access_request=access_request)
-
-    item_data_list = []
-    for item in items:
-        item_data = {'id': item.id, 'access_request_id': item.access_request.id,
-            'data_type': item.data_type, 'data_type_display': item.get_data_type_display(),
-            'status': item.status,
-            'status_set_at': item.status_set_at.isoformat() if item.status_set_at else None,
-            'created_at': item.created_at.isoformat() if item.created_at else None, }
-        item_data_list.append(item_data)
-
-    return JsonResponse({'items': item_data_list})
+    items = [serialize_item(item) for item in access_request.items.all()]
+    return HttpResponse(encode({'items': items}), content_type='application/json')
 
 
 @swagger_auto_schema(method='post',
@@ -67,7 +65,7 @@ def set_access_request_item_status(request):
             return JsonResponse({'status': 'error', 'message': 'Invalid status.'})
 
         try:
-            item = AccessRequestItem.objects.get(id=item_id)
+            item = AccessRequestItem.objects.select_related('access_request').get(id=item_id)
             item.status = status
             item.status_set_at = timezone.now()
             item.save()
@@ -76,3 +74,42 @@ def set_access_request_item_status(request):
             return JsonResponse({'status': 'error', 'message': 'AccessRequestItem not found.'})
     else:
         return JsonResponse({'status': 'error', 'message': 'Invalid request method.'})
+
+
+@swagger_auto_schema(method='post',
+    request_body=openapi.Schema(type=openapi.TYPE_OBJECT, required=['items'],
+        properties={'items': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+            type=openapi.TYPE_OBJECT, required=['item_id', 'status'],
+            properties={'item_id': openapi.Schema(type=openapi.TYPE_INTEGER,
+                                                  description='ID of the AccessRequestItem'),
+                'status': openapi.Schema(type=openapi.TYPE_STRING,
+                                         description='New status ("approved" or "rejected")'),
+                'rejection_reason': openapi.Schema(type=openapi.TYPE_STRING,
+                                                   description='Reason, for rejected items'), }, )), }, ),
+    operation_description=(
+        "Approves or rejects up to 500 pending items of the caller's access requests in one "
+        "transaction. Each item gets an outcome: updated, not_found, not_pending, duplicate or "
+        "invalid_status; items of other users' access requests are not_found."),
+    responses={200: 'Per-item outcomes', 400: 'Malformed request'})
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def set_access_request_item_statuses(request):
+    items = request.data.get('items') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({'status': 'error', 'message': 'items must be a non-empty list.'}, status=400)
+    if len(items) > MAX_BULK_STATUS_ITEMS:
+        return Response({'status': 'error',
+                         'message': f'At most {MAX_BULK_STATUS_ITEMS} items can be updated at once.'}, status=400)
+    try:
+        changes = [StatusChange(int(item['item_id']), item['status'], item.get('rejection_reason'))
+                   for item in items]
+    except (TypeError, KeyError, ValueError, AttributeError):
+        return Response({'status': 'error', 'message': 'Each item requires an integer item_id and a status.'},
+                        status=400)
+
+    outcomes = set_item_statuses(changes, user=request.user)
+    return Response({
+        'status': 'success',
+        'updated': sum(outcome.outcome == 'updated' for outcome in outcomes),
+        'results': [outcome._asdict() for outcome in outcomes],
+    })
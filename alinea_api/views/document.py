@@ -1,24 +1,45 @@
 # views/document.py
 
+import csv
+
+from django.http import Http404, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status
+import orjson
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from alinea_api.models import AccessRequest, AccessRequestItem
-from alinea_api.serializers import serialize_document
-from alinea_api.services.documents_service import DocumentService
+from alinea_api.renderers import ORJSONRenderer
+from alinea_api.serializers import serialize_document, flatten_document, dumps_document
+from alinea_api.db.mongo_client import get_mongodb_settings
+from alinea_api.services.access_decisions import allowed_data_types_many, request_decision
+from alinea_api.services.async_documents_service import async_document_service
+from alinea_api.services.documents_service import document_service
+
+# Upper bound on the per-line errors echoed back by the import endpoint; further errors are
+# only counted, so a bad upload cannot grow the response without limit.
+MAX_REPORTED_IMPORT_ERRORS = 1000
+
+# Bytes read from the request body at a time by the import endpoint.
+IMPORT_READ_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of users the batch endpoint fetches in one request.
+MAX_BATCH_USER_IDS = 200
 
-connection_uri = "mongodb://localhost:27017"
-database_name = "users"
-document_service = DocumentService(connection_uri, database_name)
+# Default and maximum page sizes of the paginated listing endpoint.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Documents per chunk written by the export endpoint; the first chunk also picks the CSV
+# columns when none are given.
+EXPORT_CHUNK_SIZE = 100
 
 class DocumentListView(APIView):
     """
     Retrieve all documents for a user or add a new document.
     """
+    renderer_classes = [ORJSONRenderer]
 
     @swagger_auto_schema(
         operation_summary="Retrieve documents by user ID",
@@ -50,7 +71,7 @@ class DocumentListView(APIView):
         if not user_doc:
             return Response({'error': 'User does not exist.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"data": serialize_document(user_doc)}, status=status.HTTP_200_OK)
+        return Response({"data": user_doc}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
         operation_summary="Add a new document for a user",
@@ -113,43 +134,218 @@ class DocumentListView(APIView):
                 "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
                 status=status.HTTP_400_BAD_REQUEST)
 
-        # Find the user document
-        user_doc = document_service.find_user_by_user_id(user_id)
-
-        if not user_doc:
-            # Create a new user document if not found
-            try:
-                new_user_doc = {"user_id": user_id, document_type: document_data}
-                document_service.create_user(new_user_doc)
-                return Response(
-                    {"message": f"New user created and {document_type} added successfully."},
-                    status=status.HTTP_201_CREATED)
-            except Exception as e:
-                return Response(
-                    {"error": f"An error occurred while creating a new user document: {str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # Add or overwrite the specific document_type field
-        update_data = {document_type: document_data}
-
-        # Update the existing user document
         try:
-            updated_count = document_service.update_user(user_doc['_id'], update_data)
-            if updated_count:
-                return Response({"message": f"{document_type} added successfully."},
-                    status=status.HTTP_201_CREATED)
-            else:
-                return Response({"error": f"Failed to add the {document_type} to the user's data."},
-                    status=status.HTTP_400_BAD_REQUEST)
+            result = document_service.upsert_document(user_id, document_type, document_data)
         except Exception as e:
             return Response({"error": f"An error occurred while adding the document: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if result.created:
+            return Response(
+                {"message": f"New user created and {document_type} added successfully."},
+                status=status.HTTP_201_CREATED)
+        # The revision $inc always modifies a matched document, even when the data is unchanged.
+        return Response({"message": f"{document_type} added successfully."},
+            status=status.HTTP_201_CREATED)
+
+
+class DocumentBatchView(APIView):
+    """
+    Retrieve the documents an entity may see for many users at once.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [ORJSONRenderer]
+
+    @swagger_auto_schema(
+        operation_summary="Retrieve documents for many users",
+        operation_description=(
+            "Fetches the documents of up to 200 users with a single MongoDB query, limited to the "
+            "document types each user has approved for `entity_id`. Results are keyed by user ID; "
+            "requested users without documents or without approved document types are listed in "
+            "`missing`."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "entity_id",
+                openapi.IN_QUERY,
+                description="The entity the documents are read for.",
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            ),
+            openapi.Parameter(
+                "user_ids",
+                openapi.IN_QUERY,
+                description="Comma-separated user IDs.",
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "fields",
+                openapi.IN_QUERY,
+                description="Comma-separated document types to return (default: all approved ones).",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+        ],
+        responses={
+            200: openapi.Response(
+                "Success",
+                examples={
+                    "application/json": {
+                        "data": {"1": {"user_id": 1, "personal_info": {"first_name": "John"}}},
+                        "missing": [2],
+                    }
+                },
+            ),
+            400: openapi.Response("Missing or invalid parameters."),
+        },
+    )
+    def get(self, request):
+        try:
+            entity_id = int(request.query_params['entity_id'])
+        except (KeyError, ValueError):
+            return Response({'error': 'entity_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user_ids = list(dict.fromkeys(
+                int(user_id) for user_id in request.query_params.get('user_ids', '').split(',') if user_id))
+        except ValueError:
+            return Response({'error': 'user_ids must be a comma-separated list of integers.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        if not user_ids:
+            return Response({'error': 'Missing user_ids parameter.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) > MAX_BATCH_USER_IDS:
+            return Response({'error': f'At most {MAX_BATCH_USER_IDS} user_ids can be requested at once.'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        valid_types = document_service.VALID_DOCUMENT_TYPES + document_service.RECORD_DOCUMENT_TYPES
+        fields = request.query_params.get('fields')
+        if fields:
+            fields = fields.split(',')
+            invalid = [field for field in fields if field not in valid_types]
+            if invalid:
+                return Response({
+                    "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
+                    status=status.HTTP_400_BAD_REQUEST)
+        else:
+            fields = valid_types
+
+        # Only the approved document types are projected, so nothing else leaves MongoDB.
+        approved = allowed_data_types_many(entity_id, user_ids)
+        visible = {user_id: [field for field in fields if field in approved[user_id]] for user_id in user_ids}
+        projected = sorted(set().union(*visible.values()))
+        documents = {}
+        if projected:
+            result = document_service.find_many_by_user_ids(
+                [user_id for user_id in user_ids if visible[user_id]], projected)
+            for user_id, document in result.documents.items():
+                data = {field: document[field] for field in visible[user_id] if field in document}
+                if data:
+                    documents[user_id] = {"user_id": user_id, **data}
+        return Response({
+            "data": {str(user_id): document for user_id, document in documents.items()},
+            "missing": [user_id for user_id in user_ids if user_id not in documents],
+        }, status=status.HTTP_200_OK)
+
+
+class DocumentPageView(APIView):
+    """
+    Page through the documents of all users.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [ORJSONRenderer]
+
+    @swagger_auto_schema(
+        operation_summary="List user documents, one page at a time",
+        operation_description=(
+            "Returns users ordered by user ID. Pass the `next_cursor` of a page as `cursor` to "
+            "get the following page; `next_cursor` is null on the last page. Every page costs "
+            "the same regardless of its depth."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="Opaque cursor returned by the previous page.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description=f"Page size (default {DEFAULT_PAGE_SIZE}, max {MAX_PAGE_SIZE}).",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
+            openapi.Parameter(
+                "document_type",
+                openapi.IN_QUERY,
+                description="Only list users that have this document type.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+            openapi.Parameter(
+                "fields",
+                openapi.IN_QUERY,
+                description="Comma-separated document types to return (default: all).",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+        ],
+        responses={
+            200: openapi.Response(
+                "Success",
+                examples={
+                    "application/json": {
+                        "results": [{"user_id": 1, "personal_info": {"first_name": "John"}}],
+                        "next_cursor": "eyJhZnRlciI6MX0=",
+                    }
+                },
+            ),
+            400: openapi.Response("Invalid parameters."),
+        },
+    )
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return Response({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}.'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        valid_types = document_service.VALID_DOCUMENT_TYPES + document_service.RECORD_DOCUMENT_TYPES
+        query = {}
+        document_type = request.query_params.get('document_type')
+        if document_type:
+            if document_type not in valid_types:
+                return Response({
+                    "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
+                    status=status.HTTP_400_BAD_REQUEST)
+            query[document_type] = {'$exists': True}
+
+        fields = request.query_params.get('fields')
+        if fields:
+            fields = fields.split(',')
+            if any(field not in valid_types for field in fields):
+                return Response({
+                    "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
+                    status=status.HTTP_400_BAD_REQUEST)
+        else:
+            fields = None
+
+        try:
+            page = document_service.paginate_users(
+                query, fields, cursor=request.query_params.get('cursor'), limit=limit)
+        except ValueError:
+            return Response({'error': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": page.documents, "next_cursor": page.next_cursor}, status=status.HTTP_200_OK)
+
 
 class DocumentDetailView(APIView):
     """
     Retrieve, update, or delete a specific document for a user.
     """
+    renderer_classes = [ORJSONRenderer]
 
     @swagger_auto_schema(
         operation_summary="Retrieve a specific document for a user",
@@ -184,15 +380,21 @@ class DocumentDetailView(APIView):
     def get(self, request, user_id, document_type):
         if not user_id or not document_type:
             return Response({'error': 'Missing user_id or document_type parameter.'}, status=status.HTTP_400_BAD_REQUEST)
-        user_doc = document_service.find_user_by_user_id(user_id)
-        if not user_doc:
+        if document_type not in document_service.VALID_DOCUMENT_TYPES + document_service.RECORD_DOCUMENT_TYPES:
+            return Response({
+                "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST)
+        user_doc = document_service.find_user_fields(user_id, [document_type], revisions=True)
+        if user_doc is None:
             return Response({'error': 'User does not exist.'}, status=status.HTTP_400_BAD_REQUEST)
 
         document = user_doc.get(document_type)
         if not document:
             return Response({'error': f'Document type "{document_type}" not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        return Response({"data": document}, status=status.HTTP_200_OK)
+        response = Response({"data": document}, status=status.HTTP_200_OK)
+        response['ETag'] = _etag(document_service.revision_of(user_doc, document_type))
+        return response
 
     @swagger_auto_schema(
         operation_summary="Update a specific document for a user",
@@ -210,6 +412,13 @@ class DocumentDetailView(APIView):
                 description="The type of document to update.",
                 type=openapi.TYPE_STRING,
             ),
+            openapi.Parameter(
+                "If-Match",
+                openapi.IN_HEADER,
+                description="ETag from a previous GET; the update fails with 412 if the document changed since.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
         ],
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
@@ -224,6 +433,7 @@ class DocumentDetailView(APIView):
             200: openapi.Response("Document updated successfully."),
             400: openapi.Response("Invalid data or document type."),
             404: openapi.Response("Document not found."),
+            412: openapi.Response("If-Match does not match the current revision."),
         },
     )
     def put(self, request, user_id, document_type):
@@ -237,49 +447,38 @@ class DocumentDetailView(APIView):
             return Response({"error": "No document data provided for update."},
                 status=status.HTTP_400_BAD_REQUEST)
 
-        if document_type not in document_service.VALID_DOCUMENT_TYPES:
+        if document_type not in document_service.VALID_DOCUMENT_TYPES + document_service.RECORD_DOCUMENT_TYPES:
             return Response({
                 "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
                 status=status.HTTP_400_BAD_REQUEST)
 
-        # Find the user document
-        user_doc = document_service.find_user_by_user_id(user_id)
-        if not user_doc:
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # For medical_records, we'll need an identifier to update a specific record
-        if document_type == 'medical_records':
-            record_id = document_data.get('record_id')
-            if not record_id:
-                return Response({"error": "record_id is required to update a medical record."},
-                    status=status.HTTP_400_BAD_REQUEST)
-            # Find and update the specific medical record
-            records = user_doc.get('medical_records', [])
-            for idx, record in enumerate(records):
-                if record.get('record_id') == record_id:
-                    records[idx].update(document_data)
-                    break
-            else:
-                return Response({"error": "Medical record not found."},
-                    status=status.HTTP_404_NOT_FOUND)
-            update_data = {'medical_records': records}
-        else:
-            # Update the specific document_type field
-            update_data = {document_type: document_data}
+        try:
+            expected_revision = _if_match_revision(request)
+        except ValueError:
+            return Response({"error": "Invalid If-Match header."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Update the user document
         try:
-            updated_count = document_service.update_user(user_doc['_id'], update_data)
-            if updated_count:
-                return Response({"message": f"{document_type} updated successfully."},
-                    status=status.HTTP_200_OK)
+            # For medical_records, we'll need an identifier to update a specific record
+            if document_type in document_service.RECORD_DOCUMENT_TYPES:
+                record_id = document_data.get('record_id')
+                if not record_id:
+                    return Response({"error": "record_id is required to update a medical record."},
+                        status=status.HTTP_400_BAD_REQUEST)
+                not_found_message = "User or medical record not found."
+                result = document_service.update_record(
+                    user_id, document_type, record_id, document_data, expected_revision=expected_revision)
             else:
-                return Response({"error": f"No changes were made to the user's {document_type}."},
-                    status=status.HTTP_400_BAD_REQUEST)
+                not_found_message = "User not found."
+                result = document_service.update_document(
+                    user_id, document_type, document_data, expected_revision=expected_revision)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"An error occurred while updating the document: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        return _write_response(result, document_type, not_found_message, f"{document_type} updated successfully.")
+
     @swagger_auto_schema(
         operation_summary="Delete a specific document for a user",
         operation_description="Deletes a specific document type for a user.",
@@ -303,69 +502,100 @@ class DocumentDetailView(APIView):
                 type=openapi.TYPE_STRING,
                 required=False,
             ),
+            openapi.Parameter(
+                "If-Match",
+                openapi.IN_HEADER,
+                description="ETag from a previous GET; the delete fails with 412 if the document changed since.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
         ],
         responses={
             200: openapi.Response("Document deleted successfully."),
             400: openapi.Response("Invalid data or document type."),
             404: openapi.Response("Document not found."),
+            412: openapi.Response("If-Match does not match the current revision."),
         },
     )
     def delete(self, request, user_id, document_type):
         """
         Deletes a specific document from a user's data in MongoDB.
         """
-        if document_type not in document_service.VALID_DOCUMENT_TYPES:
+        if document_type not in document_service.VALID_DOCUMENT_TYPES + document_service.RECORD_DOCUMENT_TYPES:
             return Response({
                 "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
                 status=status.HTTP_400_BAD_REQUEST)
 
-        # Find the user document
-        user_doc = document_service.find_user_by_user_id(user_id)
-        if not user_doc:
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Prepare the update data
-        if document_type == 'medical_records':
-            # Need to know which record to delete
-            record_id = request.query_params.get('record_id')
-            if not record_id:
-                return Response({"error": "record_id is required to delete a medical record."},
-                    status=status.HTTP_400_BAD_REQUEST)
-            # Remove the specified record
-            records = user_doc.get('medical_records', [])
-            updated_records = [record for record in records if record.get('record_id') != record_id]
-            if len(records) == len(updated_records):
-                return Response({"error": "Medical record not found."},
-                    status=status.HTTP_404_NOT_FOUND)
-            update_data = {'medical_records': updated_records}
-        else:
-            # Remove the document_type field from the user document
-            update_data = {document_type: None}
+        try:
+            expected_revision = _if_match_revision(request)
+        except ValueError:
+            return Response({"error": "Invalid If-Match header."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Update the user document
         try:
-            updated_count = document_service.update_user(user_doc['_id'], update_data)
-            if updated_count:
-                return Response({"message": f"{document_type} deleted successfully."},
-                    status=status.HTTP_200_OK)
+            if document_type in document_service.RECORD_DOCUMENT_TYPES:
+                # Need to know which record to delete
+                record_id = request.query_params.get('record_id')
+                if not record_id:
+                    return Response({"error": "record_id is required to delete a medical record."},
+                        status=status.HTTP_400_BAD_REQUEST)
+                not_found_message = "User or medical record not found."
+                result = document_service.remove_record(
+                    user_id, document_type, record_id, expected_revision=expected_revision)
             else:
-                return Response({"error": f"No changes were made to the user's {document_type}."},
-                    status=status.HTTP_400_BAD_REQUEST)
+                # Clear the document_type field on the user document
+                not_found_message = "User not found."
+                result = document_service.update_document(
+                    user_id, document_type, None, expected_revision=expected_revision)
         except Exception as e:
             return Response({"error": f"An error occurred while deleting the document: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        return _write_response(result, document_type, not_found_message, f"{document_type} deleted successfully.")
+
+
+def _etag(revision):
+    return f'"{revision}"'
+
+
+def _if_match_revision(request):
+    """
+    Returns the revision required by the If-Match header, or None when there is no header or it
+    is ``*``. Raises ValueError if the header is not a single revision ETag.
+    """
+    header = request.headers.get('If-Match', '').strip()
+    if not header or header == '*':
+        return None
+    if header.startswith('W/'):
+        header = header[2:]
+    if len(header) < 2 or header[0] != '"' or header[-1] != '"':
+        raise ValueError(header)
+    return int(header[1:-1])
+
+
+def _write_response(result, document_type, not_found_message, success_message):
+    if result.conflict:
+        response = Response({"error": f"The {document_type} was modified by another request."},
+            status=status.HTTP_412_PRECONDITION_FAILED)
+        response['ETag'] = _etag(result.revision)
+        return response
+    if not result.matched:
+        return Response({"error": not_found_message}, status=status.HTTP_404_NOT_FOUND)
+    response = Response({"message": success_message}, status=status.HTTP_200_OK)
+    response['ETag'] = _etag(result.revision)
+    return response
+
 
 class DocumentByRequestIDView(APIView):
     """
     Retrieve documents by access request ID.
     """
+    renderer_classes = [ORJSONRenderer]
 
     @swagger_auto_schema(
         operation_summary="Retrieve documents by access request ID",
         operation_description=(
             "Fetches all documents related to a specific access request ID. "
-            "Documents are grouped by their statuses: pending, approved, and rejected."
+            "Documents are grouped by their statuses: pending, approved, rejected and expired."
         ),
         manual_parameters=[
             openapi.Parameter(
@@ -395,24 +625,293 @@ class DocumentByRequestIDView(APIView):
     def get(self, request, access_request_id):
         if not access_request_id:
             return Response({'error': 'Missing access_request_id parameter.'}, status=status.HTTP_400_BAD_REQUEST)
-        access_request_obj = get_object_or_404(AccessRequest, id=access_request_id)
-        data_by_status = {'pending': [], 'approved': [], 'rejected': []}
-        access_requests = AccessRequestItem.objects.filter(access_request_id=access_request_id)
-
-        for access_request in access_requests:
-            data_by_status[access_request.status].append(access_request.data_type)
-        user = access_request_obj.user
-        user_doc = document_service.find_user_by_user_id(user.id)
-
-        if not user_doc:
+        decision = request_decision(access_request_id)
+        if decision is None:
+            raise Http404('No AccessRequest matches the given query.')
+        data_by_status = {item_status: list(data_types)
+                          for item_status, data_types in decision.data_types_by_status.items()}
+        user_doc = document_service.find_user_fields(decision.user_id, data_by_status['approved'])
+
+        if user_doc is None:
             return Response({"error": "User data not found in MongoDB"}, status=status.HTTP_404_NOT_FOUND)
 
-        data = {}
-        for data_type in data_by_status['approved']:
-            if data_type in user_doc:
-                data[data_type] = user_doc[data_type]
-            else:
-                data[data_type] = None
-        data_by_status["approved"] = data
+        data_by_status["approved"] = {
+            data_type: user_doc.get(data_type) for data_type in data_by_status['approved']
+        }
 
         return Response({"data": data_by_status}, status=status.HTTP_200_OK)
+
+
+class DocumentImportView(APIView):
+    """
+    Bulk import user documents from an NDJSON stream.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [ORJSONRenderer]
+
+    @swagger_auto_schema(
+        operation_summary="Bulk import user documents",
+        operation_description=(
+            "Accepts an NDJSON body (one JSON object per line) with `user_id`, `document_type` and "
+            "`data`. Lines are validated and upserted in bounded batches; invalid or rejected "
+            "lines are reported by line number and do not stop the import."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_STRING,
+            example='{"user_id": 1, "document_type": "personal_info", "data": {"first_name": "John"}}',
+        ),
+        responses={
+            200: openapi.Response(
+                "Import finished.",
+                examples={
+                    "application/json": {
+                        "received": 2, "created": 1, "modified": 0, "error_count": 1,
+                        "errors": [{"line": 2, "error": "Invalid document type."}],
+                    }
+                },
+            ),
+            400: openapi.Response("No data provided."),
+        },
+    )
+    def post(self, request):
+        """
+        Streams the request body line by line so memory use does not depend on upload size.
+        """
+        config = get_mongodb_settings()
+        batch_size = config['BULK_IMPORT_BATCH_SIZE']
+        summary = {"received": 0, "created": 0, "modified": 0, "error_count": 0, "errors": []}
+        batch, batch_lines = [], []
+        line_count = 0
+
+        for line_number, line in self._iter_lines(request, config['BULK_IMPORT_MAX_LINE_BYTES']):
+            line_count = line_number
+            if line is not None and not line.strip():
+                continue
+            summary["received"] += 1
+            try:
+                if line is None:
+                    raise ValueError(f"Line is longer than {config['BULK_IMPORT_MAX_LINE_BYTES']} bytes.")
+                batch.append(self._parse_line(line))
+                batch_lines.append(line_number)
+            except ValueError as e:
+                self._add_error(summary, line_number, str(e))
+                continue
+            if len(batch) >= batch_size:
+                self._flush(batch, batch_lines, summary)
+                batch, batch_lines = [], []
+        self._flush(batch, batch_lines, summary)
+
+        if not line_count:
+            return Response({"error": "No document data provided."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _iter_lines(request, max_line_bytes):
+        """
+        Yields (line number, line) for every line of the request body, read
+        ``IMPORT_READ_CHUNK_SIZE`` bytes at a time, so chunked uploads without a Content-Length
+        work too. Lines longer than ``max_line_bytes`` are yielded as None and never buffered
+        past that size.
+        """
+        buffer, line_number, too_long = b'', 0, False
+        while True:
+            chunk = request.read(IMPORT_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            start = 0
+            while True:
+                end = chunk.find(b'\n', start)
+                if end == -1:
+                    if not too_long:
+                        buffer += chunk[start:]
+                        if len(buffer) > max_line_bytes:
+                            buffer, too_long = b'', True
+                    break
+                line_number += 1
+                line = None if too_long else buffer + chunk[start:end]
+                yield line_number, None if line is None or len(line) > max_line_bytes else line
+                buffer, too_long, start = b'', False, end + 1
+        if buffer or too_long:
+            yield line_number + 1, None if too_long else buffer
+
+    @staticmethod
+    def _parse_line(line):
+        try:
+            entry = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            raise ValueError("Invalid JSON.")
+        if not isinstance(entry, dict):
+            raise ValueError("Each line must be a JSON object.")
+        user_id = entry.get('user_id')
+        if isinstance(user_id, bool) or not isinstance(user_id, int):
+            raise ValueError("user_id must be an integer.")
+        document_type = entry.get('document_type')
+        if document_type not in document_service.VALID_DOCUMENT_TYPES:
+            raise ValueError(
+                f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}.")
+        data = entry.get('data')
+        if not isinstance(data, dict) or not data:
+            raise ValueError("data must be a non-empty object.")
+        return user_id, document_type, data
+
+    def _flush(self, batch, batch_lines, summary):
+        if not batch:
+            return
+        try:
+            result = document_service.bulk_upsert_documents(batch)
+        except Exception as e:
+            for line_number in batch_lines:
+                self._add_error(summary, line_number, f"An error occurred while importing: {str(e)}")
+            return
+        summary["created"] += result.created
+        summary["modified"] += result.modified
+        for index, message in result.errors:
+            self._add_error(summary, batch_lines[index], message)
+
+    @staticmethod
+    def _add_error(summary, line_number, message):
+        summary["error_count"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_IMPORT_ERRORS:
+            summary["errors"].append({"line": line_number, "error": message})
+
+
+class DocumentExportView(APIView):
+    """
+    Export user documents as NDJSON or flattened CSV.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+    @swagger_auto_schema(
+        operation_summary="Export user documents",
+        operation_description=(
+            "Streams user documents straight from the MongoDB cursor. NDJSON emits one user "
+            "document per line; CSV flattens nested fields into dotted column names. When "
+            "`columns` is not given, CSV columns are taken from the first documents exported."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "export_format",
+                openapi.IN_QUERY,
+                description="`ndjson` (default) or `csv`.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+            openapi.Parameter(
+                "document_type",
+                openapi.IN_QUERY,
+                description="Only export users having this document type, and only that document type.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+            openapi.Parameter(
+                "columns",
+                openapi.IN_QUERY,
+                description="Comma-separated CSV columns (dotted paths, e.g. `personal_info.first_name`).",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+        ],
+        responses={
+            200: openapi.Response("Streamed export."),
+            400: openapi.Response("Invalid export format or document type."),
+        },
+    )
+    def get(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in self.EXPORT_FORMATS:
+            return Response({"error": f"Invalid export format. Valid formats are: {', '.join(self.EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        document_type = request.query_params.get('document_type')
+        if document_type:
+            if document_type not in document_service.VALID_DOCUMENT_TYPES + document_service.RECORD_DOCUMENT_TYPES:
+                return Response({
+                    "error": f"Invalid document type. Valid types are: {', '.join(document_service.VALID_DOCUMENT_TYPES)}."},
+                    status=status.HTTP_400_BAD_REQUEST)
+            query = {document_type: {"$exists": True}}
+        else:
+            query = {}
+        projection = {"_id": 0, **document_service.read_projection([document_type] if document_type else None)}
+
+        if export_format == 'csv':
+            columns = request.query_params.get('columns')
+            encoder = _CsvEncoder(columns.split(',') if columns else None)
+        else:
+            encoder = _NdjsonEncoder()
+
+        if _served_over_asgi(request):
+            # Under ASGI, Django would buffer a synchronous iterator completely before sending
+            # it, so the export is read with the async service directly on the event loop.
+            content = _async_chunks(async_document_service.iter_users(query, projection), encoder)
+        else:
+            content = _chunks(document_service.iter_users(query, projection), encoder)
+
+        response = StreamingHttpResponse(content, content_type=self.EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="documents.{export_format}"'
+        return response
+
+
+def _served_over_asgi(request) -> bool:
+    # WSGI servers must put wsgi.version in the environ; Django's ASGI handler builds META from
+    # the ASGI scope and never sets it.
+    return 'wsgi.version' not in request.META
+
+
+class _NdjsonEncoder:
+    def encode(self, documents) -> bytes:
+        return b''.join(dumps_document(doc) + b"\n" for doc in documents)
+
+
+class _CsvEncoder:
+    """
+    Encodes documents as flattened CSV rows. The header is written with the first chunk; when
+    no columns are given they are taken from the documents of that first chunk.
+    """
+
+    def __init__(self, columns=None):
+        self.columns = columns
+        self.writer = None
+
+    def encode(self, documents) -> bytes:
+        rows = [flatten_document(serialize_document(doc), exclude=document_service.INTERNAL_FIELDS)
+                for doc in documents]
+        lines = []
+        if self.writer is None:
+            if self.columns is None:
+                self.columns = list(dict.fromkeys(column for row in rows for column in row))
+            self.writer = csv.DictWriter(_Echo(), fieldnames=self.columns, extrasaction='ignore')
+            lines.append(self.writer.writeheader())
+        lines.extend(self.writer.writerow(row) for row in rows)
+        return ''.join(lines).encode()
+
+
+class _Echo:
+    """
+    File-like object whose write returns the value, so csv writers return their rows.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _chunks(documents, encoder):
+    batch, emitted = [], False
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= EXPORT_CHUNK_SIZE:
+            yield encoder.encode(batch)
+            batch, emitted = [], True
+    if batch or not emitted:
+        yield encoder.encode(batch)
+
+
+async def _async_chunks(documents, encoder):
+    batch, emitted = [], False
+    async for document in documents:
+        batch.append(document)
+        if len(batch) >= EXPORT_CHUNK_SIZE:
+            yield encoder.encode(batch)
+            batch, emitted = [], True
+    if batch or not emitted:
+        yield encoder.encode(batch)
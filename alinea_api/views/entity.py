@@ -1,10 +1,93 @@
-from rest_framework import viewsets, permissions
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
-from alinea_api.models import Entity
+from alinea_api.models import Entity, STATUS_CHOICES
+from alinea_api.pagination import AccessRequestCursorPagination
+from alinea_api.renderers import ORJSONRenderer
 from alinea_api.serializers import EntitySerializer
+from alinea_api.services import counters
+from alinea_api.services.access_decisions import allowed_data_types_many
+from alinea_api.services.access_requests import entity_inbox
+from alinea_api.services.notifications import serialize_access_request
+
+# Maximum number of users the access endpoint answers for in one request.
+MAX_ACCESS_USER_IDS = 200
 
 
 class EntityViewSet(viewsets.ModelViewSet):
     queryset = Entity.objects.all()
     serializer_class = EntitySerializer
-    permission_classes = [permissions.IsAuthenticated]
\ No newline at end of file
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Entity inbox",
+        operation_description=(
+            "Access requests of the entity with their items, newest first, one page at a time. "
+            "Follow the `next` link to get the following page."
+        ),
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Only requests with at least one item in this status.",
+                              enum=[choice for choice, _ in STATUS_CHOICES]),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description="Requests per page (default 50, max 200)."),
+        ],
+    )
+    @action(detail=True, methods=['get'], renderer_classes=[ORJSONRenderer],
+            pagination_class=AccessRequestCursorPagination)
+    def inbox(self, request, pk=None):
+        item_status = request.query_params.get('status')
+        if item_status and item_status not in dict(STATUS_CHOICES):
+            return Response({'error': f"Invalid status. Valid statuses are: {', '.join(dict(STATUS_CHOICES))}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        entity = self.get_object()
+        page = self.paginate_queryset(entity_inbox(entity.pk, item_status))
+        return self.get_paginated_response([serialize_access_request(access_request) for access_request in page])
+
+    @swagger_auto_schema(
+        operation_summary="Entity access request counts",
+        operation_description=(
+            "Number of access request items of the entity per status, overall and per data type, "
+            "read from the materialized counters."
+        ),
+        responses={200: openapi.Response("Success", examples={"application/json": {
+            "total": {"pending": 3, "approved": 5, "rejected": 1},
+            "by_data_type": {"dental": {"pending": 1, "approved": 2, "rejected": 0}},
+        }})},
+    )
+    @action(detail=True, methods=['get'], renderer_classes=[ORJSONRenderer])
+    def counts(self, request, pk=None):
+        entity = self.get_object()
+        return Response(counters.entity_counts(entity.pk), status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_summary="Data types the entity may read, per user",
+        operation_description=(
+            "For each user, the data types approved for this entity across all its access "
+            "requests. Answered from the access decision cache, with one query for all misses."
+        ),
+        manual_parameters=[
+            openapi.Parameter('user_ids', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                              description=f"Comma-separated user IDs (at most {MAX_ACCESS_USER_IDS})."),
+        ],
+        responses={200: openapi.Response("Success", examples={"application/json": {
+            "data": {"1": ["dental", "personal_info"], "2": []},
+        }}), 400: openapi.Response("Missing or invalid user_ids.")},
+    )
+    @action(detail=True, methods=['get'], renderer_classes=[ORJSONRenderer])
+    def access(self, request, pk=None):
+        try:
+            user_ids = [int(user_id) for user_id in request.query_params.get('user_ids', '').split(',') if user_id]
+        except ValueError:
+            return Response({'error': 'user_ids must be a comma-separated list of integers.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not user_ids or len(user_ids) > MAX_ACCESS_USER_IDS:
+            return Response({'error': f'Between 1 and {MAX_ACCESS_USER_IDS} user_ids are required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        entity = self.get_object()
+        allowed = allowed_data_types_many(entity.pk, user_ids)
+        return Response({'data': {str(user_id): sorted(data_types) for user_id, data_types in allowed.items()}},
+                        status=status.HTTP_200_OK)
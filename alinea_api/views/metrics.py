@@ -0,0 +1,50 @@
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_yasg.utils import swagger_auto_schema
+
+from alinea_api.db.mongo_client import command_stats, pool_stats
+from alinea_api.renderers import ORJSONRenderer
+from alinea_api.services.dispatch import event_dispatcher
+from alinea_api.services.documents_service import document_service
+
+
+class MongoMetricsView(APIView):
+    """
+    MongoDB latency, connection pool and document cache metrics of this process.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [ORJSONRenderer]
+
+    @swagger_auto_schema(
+        operation_summary="MongoDB metrics",
+        operation_description=(
+            "Latency histograms per command and collection and per endpoint, failed command "
+            "counts, connection pool checkout waits and document cache hit ratios. Counters are "
+            "per worker process and reset when it restarts."
+        ),
+    )
+    def get(self, request):
+        return Response({
+            'commands': command_stats(),
+            'pool': pool_stats(),
+            'cache': document_service.cache.stats(),
+        }, status=status.HTTP_200_OK)
+
+
+class EventMetricsView(APIView):
+    """
+    Websocket event dispatch metrics of this process.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [ORJSONRenderer]
+
+    @swagger_auto_schema(
+        operation_summary="Event dispatch metrics",
+        operation_description=(
+            "Queued, sent, failed and dropped websocket events, queue depth and channel layer "
+            "send latency per batch. Counters are per worker process."
+        ),
+    )
+    def get(self, request):
+        return Response(event_dispatcher.stats(), status=status.HTTP_200_OK)
@@ -2,15 +2,12 @@ import os
 import json
 from typing import Dict, Any
 
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 
-from alinea_api.models import (
-    AccessRequest,
-    AccessRequestItem
-)
-from alinea_api.views.document import document_service
+from alinea_api.services.access_decisions import request_decision
+from alinea_api.services.documents_service import document_service
 
 from singularity.llms.open_ai import get_opneai
 
@@ -37,23 +34,16 @@ class UserService:
 
         if not access_request_id:
             return ""
-        access_request_obj = get_object_or_404(AccessRequest, id=access_request_id)
-        data_by_status = {'pending': [], 'approved': [], 'rejected': []}
-        access_requests = AccessRequestItem.objects.filter(access_request_id=access_request_id)
-
-        for access_request in access_requests:
-            data_by_status[access_request.status].append(access_request.data_type)
-        user = access_request_obj.user
-        user_doc = document_service.find_user_by_user_id(user.id)
-        if not user_doc:
+        decision = request_decision(access_request_id)
+        if decision is None:
+            raise Http404('No AccessRequest matches the given query.')
+        data_by_status = {status: list(data_types) for status, data_types in decision.data_types_by_status.items()}
+        user_doc = document_service.find_user_fields(decision.user_id, data_by_status['approved'])
+        if user_doc is None:
             return "no info found for user"
-        data = {}
-        for data_type in data_by_status['approved']:
-            if data_type in user_doc:
-                data[data_type] = user_doc[data_type]
-            else:
-                data[data_type] = None
-        data_by_status["approved"] = data
+        data_by_status["approved"] = {
+            data_type: user_doc.get(data_type) for data_type in data_by_status['approved']
+        }
 
         # Create a LangChain prompt and generate the summary
         try: